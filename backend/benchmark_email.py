@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Email benchmark: a new SMTP connection and login per message vs. the pooled client
+
+Starts a local aiosmtpd server (pip install aiosmtpd) that accepts any login, so
+no real mailbox is needed, then sends the same messages both ways. --drop closes
+the server side of every connection once mid-run to exercise reconnects:
+    python benchmark_email.py [--messages 200] [--pool 3] [--latency 0.02] [--drop]
+"""
+import argparse
+import asyncio
+import logging
+import smtplib
+import socket
+import time
+from email.mime.text import MIMEText
+
+from mailer import SMTPConnectionPool, SMTPSettings
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+except ImportError:
+    Controller = None
+
+class CountingHandler:
+    """Accepts every message; `latency` simulates the round trip to a remote server on connect"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.messages = 0
+        self.connections = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        if server not in self.connections:
+            self.connections.append(server)
+            await asyncio.sleep(self.latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return '250 OK'
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+def make_message(index: int) -> MIMEText:
+    message = MIMEText(f"<p>Hello lead {index}</p>", 'html')
+    message['From'] = 'bench@example.com'
+    message['To'] = f'lead{index}@example.com'
+    message['Subject'] = f'Benchmark {index}'
+    return message
+
+def send_unpooled(settings: SMTPSettings, message: MIMEText):
+    """The previous behaviour: connect, log in, send and quit for every message"""
+    with smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout) as server:
+        server.login(settings.username, settings.password)
+        server.sendmail(message['From'], [message['To']], message.as_string())
+
+async def run_unpooled(settings: SMTPSettings, count: int, concurrency: int) -> float:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(index: int):
+        async with semaphore:
+            await loop.run_in_executor(None, send_unpooled, settings, make_message(index))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send(i) for i in range(count)])
+    return time.perf_counter() - start
+
+async def run_pooled(pool: SMTPConnectionPool, count: int, drop=None) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[pool.send(make_message(i), 'bench@example.com', [f'lead{i}@example.com']) for i in range(count // 2)])
+    if drop:
+        drop()
+    await asyncio.gather(*[pool.send(make_message(i), 'bench@example.com', [f'lead{i}@example.com']) for i in range(count // 2, count)])
+    elapsed = time.perf_counter() - start
+    await pool.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--pool', type=int, default=3, help='pool size, also the concurrency of the unpooled run')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to each new connection')
+    parser.add_argument('--drop', action='store_true', help='drop all server connections halfway through the pooled run')
+    args = parser.parse_args()
+
+    if Controller is None:
+        print("❌ aiosmtpd is not installed (pip install aiosmtpd)")
+        return
+    logging.getLogger('mail.log').setLevel(logging.ERROR)  # aiosmtpd warns about its own AUTH internals
+
+    handler = CountingHandler(args.latency)
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port(), authenticator=accept_any_login, auth_require_tls=False)
+    controller.start()
+    try:
+        settings = SMTPSettings('127.0.0.1', controller.port, use_ssl=False, starttls=False,
+                                username='bench@example.com', password='secret')
+
+        def drop_connections():
+            for server in handler.connections:
+                if server.transport is not None:
+                    controller.loop.call_soon_threadsafe(server.transport.close)
+            time.sleep(0.1)
+
+        print(f"🧪 Email benchmark: {args.messages} messages, {args.pool} at a time, {args.latency * 1000:.0f} ms connect latency")
+        print("=" * 64)
+        unpooled = asyncio.run(run_unpooled(settings, args.messages, args.pool))
+        unpooled_connections = len(handler.connections)
+        handler.connections.clear()
+        pool = SMTPConnectionPool(settings, size=args.pool)
+        pooled = asyncio.run(run_pooled(pool, args.messages, drop_connections if args.drop else None))
+
+        for label, seconds, connections in (("Connection per message:", unpooled, unpooled_connections),
+                                            ("Pooled connections:", pooled, len(handler.connections))):
+            print(f"{label:<25}{seconds * 1000 / args.messages:8.2f} ms/message, {connections} connections")
+        print(f"Speedup: {unpooled / pooled:.2f}x")
+        print(f"Pool: {pool.stats()}")
+        print(f"Messages received: {handler.messages}")
+    finally:
+        controller.stop()
+
+if __name__ == '__main__':
+    main()
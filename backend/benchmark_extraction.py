@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Lead extraction benchmark: the previous multi-regex extractor vs. the single-pass scanner
+
+Checks that the scanner finds phone numbers in common national and international
+formats, runs both over synthetic OCR output of growing size (contact blocks mixed
+with numeric table noise), then times layout-aware assembly over growing grids of
+scanned cards, printing time per size so the scaling is visible:
+    python benchmark_extraction.py [--sizes 16,64,256,1024] [--cards 10,100,1000,5000] [--repeat 3]
+"""
+import argparse
+import random
+import re
+import time
+
+from extraction import OCRWord, extract_leads, extract_leads_from_blocks, group_contact_blocks, scan_lead_entities
+
+FIRST_NAMES = ['John', 'Maria', 'Ahmed', 'Wei', 'Priya', 'Lucas', 'Emma', 'Kenji']
+LAST_NAMES = ['Smith', 'Garcia', 'Khan', 'Chen', 'Patel', 'Silva', 'Brown', 'Sato']
+
+# Phone numbers as printed on cards, and what the scanner should normalize them to
+PHONE_FORMATS = [
+    ('+1 555-123-4567', '+15551234567'),
+    ('(555) 123-4567', '5551234567'),
+    ('555.123.4567', '5551234567'),
+    ('07700 900123', '07700900123'),
+    ('+44 7700 900123', '+447700900123'),
+    ('030 12345678', '03012345678'),
+    ('+49 30 12345678', '+493012345678'),
+    ('+91 98765 43210', '+919876543210'),
+    ('+55 11 91234-5678', '+5511912345678'),
+]
+
+def legacy_extract(text: str):
+    """The regexes and matching of the original extract_lead_info_advanced, kept as a baseline"""
+    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+    phone_patterns = [
+        r'(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})',
+        r'(?:\+?[1-9]\d{0,3}[-.\s]?)?(?:\(?(\d{1,4})\)?[-.\s]?)?(\d{1,4})[-.\s]?(\d{1,4})[-.\s]?(\d{1,9})',
+        r'(\d{3})[-.\s]?(\d{3})[-.\s]?(\d{4})',
+    ]
+    name_patterns = [
+        r'(?:^|\n|\r)([A-Z][a-z]+ [A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
+        r'Name:?\s*([A-Z][a-z]+ [A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
+        r'Contact:?\s*([A-Z][a-z]+ [A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
+    ]
+    emails = list(set(re.findall(email_pattern, text, re.IGNORECASE)))
+    phones = set()
+    for pattern in phone_patterns:
+        for match in re.findall(pattern, text):
+            phone = re.sub(r'[^\d+]', '', ''.join(match) if isinstance(match, tuple) else match)
+            if len(phone) >= 10:
+                phones.add(phone)
+    names = set()
+    for pattern in name_patterns:
+        names.update(re.findall(pattern, text, re.MULTILINE))
+    return emails, list(phones), list(names)
+
+def synthetic_ocr_text(size_kb: int, seed: int = 7) -> str:
+    """Business-card blocks interleaved with the numeric noise OCR produces from tables and barcodes"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    i = 0
+    while length < size_kb * 1024:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        block = (
+            f"{first} {last}\nAccount Manager\n{first.lower()}.{last.lower()}{i}@example.com\n"
+            f"+1 555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}\n"
+            f"Invoice {' '.join(str(rng.randint(0, 99999)) for _ in range(12))}\n"
+            f"{''.join(str(rng.randint(0, 9)) for _ in range(60))}\n"
+            f"{'.'.join(str(rng.randint(0, 999)) for _ in range(15))}\n\n"
+        )
+        parts.append(block)
+        length += len(block)
+        i += 1
+    return ''.join(parts)
+
+def synthetic_card_grid(cards: int, columns: int = 4):
+    """OCR words of business cards scanned in a grid; tesseract often merges a row of cards into shared lines"""
+    words = []
+    for i in range(cards):
+        x, y = (i % columns) * 900, (i // columns) * 560
+        first, last = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[(i * 3) % len(LAST_NAMES)]
+        lines = [f"{first} {last}", "Account Manager", f"{first.lower()}{i}@example.com", f"555-{100 + i % 900}-{1000 + i % 9000}"]
+        for row, line in enumerate(lines):
+            left = x
+            for word in line.split():
+                words.append(OCRWord(word, left, y + row * 45, len(word) * 16, 32, (i // columns) * 4 + row))
+                left += len(word) * 16 + 14
+    return words
+
+def best_time(func, text, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='16,64,256,1024', help='text sizes in KB')
+    parser.add_argument('--cards', default='10,100,1000,5000', help='business cards per layout benchmark run')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print("🧪 Lead extraction benchmark")
+    print("=" * 64)
+    print(f"{'phone format':<20} {'scanner':<16} {'legacy':<6}")
+    missed = 0
+    for printed, expected in PHONE_FORMATS:
+        text = f"Jane Doe\njane@example.com\n{printed}\n"
+        found = [entity.value for entity in scan_lead_entities(text) if entity.kind == 'phone']
+        missed += expected not in found
+        mark = '✅' if expected in found else '❌'
+        print(f"{printed:<20} {mark} {(found or ['-'])[0]:<14} {'found' if legacy_extract(text)[1] else 'missed':<6}")
+    print(f"{len(PHONE_FORMATS) - missed}/{len(PHONE_FORMATS)} phone formats recognized")
+    print()
+
+    print(f"{'size':>8} {'legacy ms':>12} {'scanner ms':>12} {'speedup':>9} {'scanner ms/MB':>15}")
+    for size_kb in (int(size) for size in args.sizes.split(',')):
+        text = synthetic_ocr_text(size_kb)
+        legacy = best_time(legacy_extract, text, args.repeat)
+        scanner = best_time(extract_leads, text, args.repeat)
+        per_mb = scanner * 1000 / (len(text) / (1024 * 1024))
+        print(f"{size_kb:>6}KB {legacy * 1000:>12.1f} {scanner * 1000:>12.1f} {legacy / scanner:>8.1f}x {per_mb:>15.1f}")
+
+    print()
+    print("Layout-aware assembly (cards scanned in a grid)")
+    print(f"{'cards':>8} {'words':>8} {'leads':>7} {'ms':>10} {'us/word':>9}")
+    for cards in (int(count) for count in args.cards.split(',')):
+        words = synthetic_card_grid(cards)
+        seconds = best_time(lambda w: extract_leads_from_blocks(group_contact_blocks(w)), words, args.repeat)
+        leads = extract_leads_from_blocks(group_contact_blocks(words))
+        print(f"{cards:>8} {len(words):>8} {len(leads):>7} {seconds * 1000:>10.1f} {seconds * 1e6 / len(words):>9.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+OCR benchmark: sequential multi-PSM baseline vs. the parallel early-exit PSM strategy,
+each with and without image preprocessing
+
+Generates synthetic business cards (flat scans, skewed scans and large phone photos
+of a card on a table), so only tesseract itself is required; --corpus adds a folder
+of real card images:
+    python benchmark_ocr.py [--images 8] [--workers 4] [--corpus DIR] [--engine auto]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+from main import extract_lead_info_advanced
+from ocr import (
+    OCR_CHAR_WHITELIST, ImagePreprocessor, OCRWorkerPool, PreprocessSettings, PSMStrategy,
+    extract_image_text_adaptive, load_image_for_ocr, resolve_ocr_engine
+)
+
+FIRST_NAMES = ['John', 'Maria', 'Ahmed', 'Wei', 'Priya', 'Lucas', 'Emma', 'Kenji']
+LAST_NAMES = ['Smith', 'Garcia', 'Khan', 'Chen', 'Patel', 'Silva', 'Brown', 'Sato']
+
+def load_font(size: int):
+    for path in ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/Library/Fonts/Arial.ttf', 'C:\\Windows\\Fonts\\arial.ttf'):
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default()
+
+CARD_KINDS = ('scan', 'skewed', 'photo')
+
+def draw_card(index: int, background='white') -> Image.Image:
+    """Draw a business card with one contact"""
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[(index * 3) % len(LAST_NAMES)]
+    image = Image.new('RGB', (1050, 600), background)
+    draw = ImageDraw.Draw(image)
+    font = load_font(42)
+    lines = [
+        f"{first} {last}",
+        "Sales Director",
+        f"{first.lower()}.{last.lower()}@example{index}.com",
+        f"+1 555-{100 + index:03d}-{4000 + index:04d}",
+    ]
+    for row, line in enumerate(lines):
+        draw.text((70, 80 + row * 110), line, fill='black', font=font)
+    return image
+
+def make_card(path: str, index: int, kind: str = 'scan'):
+    """Save a card as a flat scan, a scan skewed by a few degrees, or a 12 MP phone photo on a table"""
+    if kind == 'scan':
+        draw_card(index).save(path)
+    elif kind == 'skewed':
+        angle = 3 if index % 2 else -3
+        draw_card(index).rotate(angle, expand=True, fillcolor='white', resample=Image.Resampling.BICUBIC).save(path)
+    else:
+        photo = Image.new('RGB', (4032, 3024), (95, 85, 80))
+        card = draw_card(index, background=(236, 232, 222)).resize((2400, 1371), Image.Resampling.LANCZOS)
+        card = card.rotate(2, expand=True, fillcolor=(95, 85, 80), resample=Image.Resampling.BICUBIC)
+        photo.paste(card, (800, 800))
+        photo.save(path, quality=90)
+
+def baseline_ocr(path: str) -> str:
+    """The previous behaviour: four PSM modes in sequence, keep the longest text"""
+    image = load_image_for_ocr(path)
+    best_text = ""
+    for psm in (6, 4, 3, 1):
+        config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist={OCR_CHAR_WHITELIST}'
+        text = pytesseract.image_to_string(image, config=config)
+        if len(text.strip()) > len(best_text.strip()):
+            best_text = text
+    return best_text
+
+async def run_strategy(paths, workers: int, preprocessor: ImagePreprocessor, engine: str):
+    pool = OCRWorkerPool(workers, timeout=300, engine=engine)
+    strategy = PSMStrategy([6, 4, 3, 1], confidence_threshold=75, min_leads=1)
+    pool.start()
+    await pool.run(os.getpid)  # make sure workers are up before timing
+    timings, yields = [], []
+    for path in paths:
+        start = time.perf_counter()
+        text, _ = await extract_image_text_adaptive(
+            pool, strategy, path, lambda t: len(extract_lead_info_advanced(t)), preprocessor
+        )
+        timings.append(time.perf_counter() - start)
+        yields.append(len(extract_lead_info_advanced(text)))
+    pool.shutdown()
+    return timings, yields, strategy.stats()
+
+async def run_queued_jobs(jobs: int, seconds: float, timeout: float):
+    """Jobs queued behind a single worker, each shorter than the timeout on its own"""
+    pool = OCRWorkerPool(1, timeout=timeout)
+    pool.start()
+    await pool.run(os.getpid)
+    outcomes = await asyncio.gather(*[pool.run(time.sleep, seconds) for _ in range(jobs)], return_exceptions=True)
+    pool.shutdown()
+    return ['ok' if outcome is None else type(outcome).__name__ for outcome in outcomes]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--corpus', help='folder of real card images (.png/.jpg) to benchmark as well')
+    parser.add_argument('--engine', default='auto', help='OCR engine of the parallel runs: auto, tesserocr or pytesseract')
+    args = parser.parse_args()
+    engine = resolve_ocr_engine(args.engine)
+
+    outcomes = asyncio.run(run_queued_jobs(3, 0.8, 1.5))
+    mark = '✅' if outcomes == ['ok'] * 3 else '❌'
+    print(f"{mark} Three 0.8s jobs on 1 worker with a 1.5s timeout: {outcomes}")
+
+    if not shutil.which(pytesseract.pytesseract.tesseract_cmd):
+        print("❌ tesseract is not installed or not on PATH")
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = {kind: [] for kind in CARD_KINDS}
+        for i in range(args.images):
+            for kind in CARD_KINDS:
+                path = os.path.join(folder, f'{kind}_{i}.{"jpg" if kind == "photo" else "png"}')
+                make_card(path, i, kind)
+                corpus[kind].append(path)
+        if args.corpus:
+            corpus['corpus'] = sorted(
+                os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+                if name.lower().endswith(('.png', '.jpg', '.jpeg'))
+            )
+        paths = [path for kind_paths in corpus.values() for path in kind_paths]
+
+        print(f"🧪 OCR benchmark: {len(paths)} images, {args.workers} workers, {engine} engine")
+        print("=" * 64)
+
+        baseline_timings, baseline_yields = [], []
+        for path in paths:
+            start = time.perf_counter()
+            text = baseline_ocr(path)
+            baseline_timings.append(time.perf_counter() - start)
+            baseline_yields.append(len(extract_lead_info_advanced(text)))
+
+        legacy = ImagePreprocessor(PreprocessSettings(steps=()))
+        preprocessed = ImagePreprocessor(PreprocessSettings())
+        timings, yields, stats = asyncio.run(run_strategy(paths, args.workers, legacy, engine))
+        pre_timings, pre_yields, pre_stats = asyncio.run(run_strategy(paths, args.workers, preprocessed, engine))
+
+        baseline_mean = statistics.mean(baseline_timings)
+        strategy_mean = statistics.mean(timings)
+        preprocessed_mean = statistics.mean(pre_timings)
+        for label, mean, leads in (("Sequential PSM 6,4,3,1:", baseline_mean, baseline_yields),
+                                   ("Parallel early-exit:", strategy_mean, yields),
+                                   ("Parallel early-exit, preprocessed:", preprocessed_mean, pre_yields)):
+            print(f"{label:<35}{mean * 1000:8.0f} ms/image, {sum(leads)} leads")
+        print(f"Speedup: {baseline_mean / strategy_mean:.2f}x early exit, {baseline_mean / preprocessed_mean:.2f}x with preprocessing")
+        print(f"Learned PSM wins: {stats} / preprocessed {pre_stats}")
+        print(f"Preprocessing: {preprocessed.stats()}")
+
+        print()
+        print(f"{'images':>8} {'count':>6} {'raw ms':>9} {'raw leads':>10} {'prep ms':>9} {'prep leads':>11}")
+        offset = 0
+        for kind, kind_paths in corpus.items():
+            window = slice(offset, offset + len(kind_paths))
+            offset += len(kind_paths)
+            if not kind_paths:
+                continue
+            print(f"{kind:>8} {len(kind_paths):>6} {statistics.mean(timings[window]) * 1000:>9.0f} "
+                  f"{sum(yields[window]):>10} {statistics.mean(pre_timings[window]) * 1000:>9.0f} {sum(pre_yields[window]):>11}")
+
+if __name__ == '__main__':
+    main()
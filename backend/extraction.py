@@ -0,0 +1,181 @@
+"""
+Lead extraction from OCR / PDF text: one precompiled scanner, one pass over the text
+"""
+import re
+from typing import Dict, List, NamedTuple
+
+# Emails only start at a token boundary, so a long token without '@' is scanned once, not once per character
+EMAIL_PATTERN = r'(?<![A-Za-z0-9._%+-])[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b'
+
+# Bounded phone grammar: optional +country code, optional (area code), then either 2-6
+# groups of 2-8 digits joined by single separators (e.g. UK "07700 900123", German
+# "030 12345678") or one unseparated run of 7-15 digits. Every repetition has a fixed
+# upper bound and matches can't start inside a digit run, so long numeric OCR noise is
+# matched in linear time; the 10-15 total digit check then drops implausible numbers.
+PHONE_PATTERN = (
+    r'(?<![\w+])(?:\+\d{1,3}[-. ]?)?(?:\(\d{1,4}\)[-. ]?)?'
+    r'(?:\d{2,8}(?:[-. ]\d{2,8}){1,5}|\d{7,15})(?![\w])'
+)
+PHONE_MIN_DIGITS = 10
+PHONE_MAX_DIGITS = 15
+
+# Two or three capitalized words at the start of a line, or after a "Name:" / "Contact:" label
+NAME_PATTERN = r'[A-Z][a-z]+ [A-Z][a-z]+(?: [A-Z][a-z]+)?'
+NAME_PREFIX_PATTERN = r'(?:^|(?:Name|Contact):?\s*)'
+
+LEAD_ENTITY_PATTERN = re.compile(
+    rf'(?P<email>{EMAIL_PATTERN})|(?P<phone>{PHONE_PATTERN})|{NAME_PREFIX_PATTERN}(?P<name>{NAME_PATTERN})',
+    re.MULTILINE
+)
+NON_PHONE_CHARS = re.compile(r'[^\d]')
+
+class LeadEntity(NamedTuple):
+    kind: str  # email | phone | name
+    value: str
+    start: int
+    end: int
+
+def normalize_phone(raw: str) -> str:
+    """Digits only, keeping a leading '+'; empty if the digit count isn't a plausible phone number"""
+    digits = NON_PHONE_CHARS.sub('', raw)
+    if not PHONE_MIN_DIGITS <= len(digits) <= PHONE_MAX_DIGITS:
+        return ''
+    return f"+{digits}" if raw.startswith('+') else digits
+
+def scan_lead_entities(text: str) -> List[LeadEntity]:
+    """Find emails, phone numbers and names in document order with their offsets in `text`"""
+    entities = []
+    for match in LEAD_ENTITY_PATTERN.finditer(text):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'phone':
+            value = normalize_phone(value)
+            if not value:
+                continue
+        entities.append(LeadEntity(kind, value, match.start(kind), match.end(kind)))
+    return entities
+
+def assemble_leads(entities: List[LeadEntity]) -> List[Dict[str, str]]:
+    """Pair entities into leads: one lead per distinct email, matched with names and phones by order of appearance"""
+    found: Dict[str, Dict[str, None]] = {'email': {}, 'phone': {}, 'name': {}}
+    for entity in entities:
+        found[entity.kind].setdefault(entity.value, None)
+    emails, phones, names = list(found['email']), list(found['phone']), list(found['name'])
+
+    leads = []
+    for i, email in enumerate(emails):
+        if i < len(names):
+            name = names[i]
+        elif names:
+            name = names[0]
+        else:
+            # Try to generate name from email
+            name = email.split('@')[0].replace('.', ' ').replace('_', ' ').title()
+        phone = phones[i] if i < len(phones) else (phones[0] if phones else '')
+        leads.append({'email': email, 'name': name, 'phone': phone})
+    return leads
+
+def extract_leads(text: str) -> List[Dict[str, str]]:
+    """Extract leads (email, name, phone) from free text"""
+    return assemble_leads(scan_lead_entities(text))
+
+# Layout-aware assembly
+class OCRWord(NamedTuple):
+    text: str
+    left: int
+    top: int
+    width: int
+    height: int
+    line: int  # tesseract line this word belongs to
+
+class _Segment(NamedTuple):
+    left: int
+    top: int
+    right: int
+    bottom: int
+    text: str
+
+def _line_segments(words: List[OCRWord]) -> List[_Segment]:
+    """Tesseract lines split wherever a horizontal gap is wide enough to separate columns"""
+    lines: Dict[int, List[OCRWord]] = {}
+    for word in words:
+        lines.setdefault(word.line, []).append(word)
+    segments = []
+    for line_words in lines.values():
+        line_words.sort(key=lambda w: w.left)
+        height = max(w.height for w in line_words)
+        current = [line_words[0]]
+        for word in line_words[1:]:
+            previous = current[-1]
+            if word.left - (previous.left + previous.width) > 3 * height:
+                segments.append(_segment(current))
+                current = []
+            current.append(word)
+        segments.append(_segment(current))
+    return segments
+
+def _segment(words: List[OCRWord]) -> _Segment:
+    return _Segment(
+        min(w.left for w in words), min(w.top for w in words),
+        max(w.left + w.width for w in words), max(w.top + w.height for w in words),
+        ' '.join(w.text for w in words)
+    )
+
+def group_contact_blocks(words: List[OCRWord], gap_factor: float = 1.5) -> List[str]:
+    """Group OCR words into spatially separate blocks (e.g. one per business card), in reading order.
+
+    Line segments are joined when they overlap horizontally and are at most
+    `gap_factor` line heights apart vertically. Candidates are found through a
+    uniform grid keyed by segment position, so grouping stays roughly linear in
+    the number of words instead of comparing every pair of lines.
+    """
+    segments = _line_segments([w for w in words if w.text.strip()])
+    if not segments:
+        return []
+    heights = sorted(s.bottom - s.top for s in segments)
+    line_height = max(1, heights[len(heights) // 2])
+    reach = int(gap_factor * line_height)
+    cell = 4 * line_height
+
+    parent = list(range(len(segments)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    grid: Dict[tuple, List[int]] = {}
+    for i, segment in enumerate(segments):
+        # Grid cells covered by the segment grown by `reach` downwards and upwards
+        cells = [
+            (cx, cy)
+            for cx in range(segment.left // cell, segment.right // cell + 1)
+            for cy in range((segment.top - reach) // cell, (segment.bottom + reach) // cell + 1)
+        ]
+        neighbours = {j for key in cells for j in grid.get(key, ())}
+        for j in neighbours:
+            other = segments[j]
+            overlaps = segment.left <= other.right and other.left <= segment.right
+            gap = max(segment.top - other.bottom, other.top - segment.bottom)
+            if overlaps and gap <= reach:
+                parent[find(i)] = find(j)
+        for key in cells:
+            grid.setdefault(key, []).append(i)
+
+    blocks: Dict[int, List[_Segment]] = {}
+    for i, segment in enumerate(segments):
+        blocks.setdefault(find(i), []).append(segment)
+    ordered = sorted(blocks.values(), key=lambda block: (min(s.top for s in block) // cell, min(s.left for s in block)))
+    return ['\n'.join(s.text for s in sorted(block, key=lambda s: (s.top, s.left))) for block in ordered]
+
+def extract_leads_from_blocks(blocks: List[str]) -> List[Dict[str, str]]:
+    """Assemble leads separately inside each layout block, so contacts are never paired across blocks"""
+    leads = []
+    seen = set()
+    for block in blocks:
+        for lead in assemble_leads(scan_lead_entities(block)):
+            if lead['email'].lower() not in seen:
+                seen.add(lead['email'].lower())
+                leads.append(lead)
+    return leads
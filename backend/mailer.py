@@ -0,0 +1,181 @@
+"""
+Pooled SMTP client: authenticated connections are kept open and reused across messages
+"""
+import asyncio
+import logging
+import smtplib
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Any, Deque, Dict, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a connection is gone (as opposed to the server refusing one message)
+CONNECTION_LOST = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+class SMTPSettings(NamedTuple):
+    host: str = 'smtp.gmail.com'
+    port: int = 465
+    use_ssl: bool = True  # implicit TLS; otherwise plain SMTP, upgraded with STARTTLS if `starttls`
+    starttls: bool = True
+    username: str = ''  # no login when empty
+    password: str = ''
+    timeout: float = 30.0
+
+class _Connection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+class SMTPConnectionPool:
+    """Up to `size` authenticated SMTP connections, each reused for many messages.
+
+    smtplib is blocking, so messages are sent on a dedicated thread pool of
+    `size` threads, which also bounds how many are in flight at once. A
+    connection that sat idle for more than `noop_after` seconds is checked
+    with NOOP before reuse; after `idle_timeout` seconds or `max_messages`
+    messages it is closed instead. A send that fails because the server
+    dropped a reused connection is retried once on a fresh one.
+    """
+
+    def __init__(self, settings: SMTPSettings, size: int = 3, idle_timeout: float = 60.0,
+                 noop_after: float = 10.0, max_messages: int = 100):
+        self.settings = settings
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.max_messages = max_messages
+        self._idle: Deque[_Connection] = deque()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='smtp')
+        self.counters = {
+            'connectionsOpened': 0, 'connectionsReused': 0, 'noopChecks': 0,
+            'reconnects': 0, 'messagesSent': 0, 'failures': 0,
+        }
+
+    async def send(self, message: Message, from_addr: str, to_addrs: List[str]):
+        """Send one message over a pooled connection"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._send, message, from_addr, to_addrs)
+
+    async def close(self):
+        """QUIT all idle connections (e.g. on shutdown); the pool opens new ones if used again"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_idle)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, size=self.size, idle=len(self._idle))
+
+    def _send(self, message: Message, from_addr: str, to_addrs: List[str]):
+        text = message.as_string()
+        try:
+            connection, reused = self._checkout()
+        except BaseException:
+            self._count('failures')
+            raise
+        while True:
+            try:
+                connection.smtp.sendmail(from_addr, to_addrs, text)
+                break
+            except CONNECTION_LOST as e:
+                self._discard(connection)
+                if not reused:
+                    self._count('failures')
+                    raise
+                # The server closed a connection we held on to: one more try on a new one
+                logger.warning(f"Pooled SMTP connection was dropped ({e}), reconnecting")
+                self._count('reconnects')
+                try:
+                    connection, reused = self._open(), False
+                except BaseException:
+                    self._count('failures')
+                    raise
+            except smtplib.SMTPException:
+                # Rejected by the server (recipient, sender, data); smtplib has reset the session, so it stays usable
+                self._checkin(connection)
+                self._count('failures')
+                raise
+            except BaseException:
+                self._discard(connection)
+                self._count('failures')
+                raise
+        connection.sent += 1
+        self._count('messagesSent')
+        self._checkin(connection)
+
+    def _checkout(self) -> Tuple[_Connection, bool]:
+        """An idle connection that is still alive, or a new one; also says whether it was reused"""
+        while True:
+            with self._lock:
+                # Most recently used first: the likeliest to still be open
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._open(), False
+            idle = time.monotonic() - connection.last_used
+            if idle > self.idle_timeout:
+                self._discard(connection)
+                continue
+            if idle > self.noop_after:
+                self._count('noopChecks')
+                try:
+                    alive = connection.smtp.noop()[0] == 250
+                except (smtplib.SMTPException, OSError):
+                    alive = False
+                if not alive:
+                    self._count('reconnects')
+                    self._discard(connection)
+                    continue
+            self._count('connectionsReused')
+            return connection, True
+
+    def _checkin(self, connection: _Connection):
+        connection.last_used = time.monotonic()
+        if connection.sent >= self.max_messages:
+            self._discard(connection)
+            return
+        with self._lock:
+            self._idle.append(connection)
+            expired = []
+            while self._idle and connection.last_used - self._idle[0].last_used > self.idle_timeout:
+                expired.append(self._idle.popleft())
+        for stale in expired:
+            self._discard(stale)
+
+    def _open(self) -> _Connection:
+        settings = self.settings
+        if settings.use_ssl:
+            smtp = smtplib.SMTP_SSL(settings.host, settings.port, timeout=settings.timeout,
+                                    context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout)
+        try:
+            if not settings.use_ssl and settings.starttls:
+                smtp.starttls(context=ssl.create_default_context())
+            if settings.username:
+                smtp.login(settings.username, settings.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self._count('connectionsOpened')
+        return _Connection(smtp)
+
+    def _discard(self, connection: _Connection):
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+    def _close_idle(self):
+        with self._lock:
+            connections = list(self._idle)
+            self._idle.clear()
+        for connection in connections:
+            self._discard(connection)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
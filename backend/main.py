@@ -1,27 +1,39 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import pandas as pd
 import os
 import uuid
-import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_path, convert_from_bytes
-import PyPDF2
 import io
-import re
+import csv
+import json
 from datetime import datetime
 import logging
 import aiofiles
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, EmailStr
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable, Iterator, Set, Tuple
+from pydantic import BaseModel, EmailStr, TypeAdapter, ValidationError
 from dotenv import load_dotenv
 import tempfile
 import asyncio
+import argparse
+import hashlib
+import math
+import mimetypes
+import zipfile
+from contextlib import contextmanager
+from functools import partial
+import time
+from collections import OrderedDict
+from ocr import (
+    OCR_CHAR_WHITELIST, DocumentSource, DocumentTooLarge, ExtractionCache, ImagePreprocessor, OCRError,
+    OCRWorkerPool, PreprocessSettings, PSMStrategy, ResourceGuard, ResourceLimits, extract_image_text_adaptive, extract_text_from_pdf, iter_pdf_pages,
+    parse_preprocess_steps, resolve_ocr_engine
+)
+from extraction import assemble_leads, extract_leads_from_blocks, scan_lead_entities
+from mailer import SMTPConnectionPool, SMTPSettings
+from storage import LEAD_COLUMNS, LeadStore, LeadStorage, CSVStorage, JournaledCSVStorage, LeadJournal, SQLiteStorage
 
 # Load environment variables
 load_dotenv()
@@ -38,6 +50,27 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+class UploadSizeLimitMiddleware:
+    """Answers 413 to upload requests whose Content-Length is over their UPLOAD_REQUEST_LIMITS entry
+    (plus the multipart framing allowance), before the body is read"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            limit = UPLOAD_REQUEST_LIMITS.get(scope['path'])
+            length = dict(scope['headers']).get(b'content-length', b'')
+            if limit is not None and length.isdigit() and int(length) > limit + MULTIPART_OVERHEAD:
+                detail = f"File too large. Maximum size is {limit // (1024 * 1024)}MB"
+                response = JSONResponse(status_code=413, content={'detail': detail})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added before CORS so that CORS wraps it and 413 responses stay readable by the browser
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Enhanced CORS Configuration for development
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +85,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count"],
 )
 
 # Configuration
@@ -59,6 +93,75 @@ UPLOAD_FOLDER = 'uploads'
 CSV_FILE = 'leads.csv'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 256 * 1024  # uploads are read, hashed and size-checked in chunks
+UPLOAD_SPOOL_SIZE = int(os.getenv('UPLOAD_SPOOL_SIZE', str(4 * 1024 * 1024)))  # larger uploads are spooled to disk
+MULTIPART_OVERHEAD = 64 * 1024  # allowance for form boundaries and headers in the request body
+MAX_BATCH_FILES = 500  # documents per batch upload, counting ZIP entries
+MAX_BATCH_SIZE = 200 * 1024 * 1024  # 200MB per batch request (and per ZIP archive)
+# Upload size limit per route; requests whose Content-Length exceeds it (plus MULTIPART_OVERHEAD) are rejected before the body is read
+UPLOAD_REQUEST_LIMITS = {
+    '/api/upload': MAX_FILE_SIZE,
+    '/api/upload/jobs': MAX_FILE_SIZE,
+    '/api/upload/stream': MAX_FILE_SIZE,
+    '/api/upload/batch': MAX_BATCH_SIZE,
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000  # leads serialized per streamed chunk
+RESPONSE_CACHE_SIZE = 64  # serialized lead listings kept for the current store version
+EVENT_QUEUE_SIZE = 100  # pending live-update events per subscriber before coalescing
+EVENT_MAX_LEADS = 100  # larger changes are announced as a resync instead of inline
+EVENT_HEARTBEAT_INTERVAL = 15  # seconds
+MAX_BULK_LEADS = 10000  # rows accepted by a single bulk import
+CHANGE_LOG_SIZE = int(os.getenv('CHANGE_LOG_SIZE', '10000'))  # lead changes kept for delta sync
+
+# Lead persistence: 'journal' appends mutations to JOURNAL_FILE and periodically
+# compacts them into CSV_FILE, 'csv' rewrites CSV_FILE on every mutation and
+# 'sqlite' stores leads in SQLITE_FILE (seeded once from CSV_FILE)
+STORAGE_MODES = ('journal', 'csv', 'sqlite')
+LEAD_STORAGE_MODE = os.getenv('LEAD_STORAGE_MODE', 'journal')
+JOURNAL_FILE = 'leads.journal'
+SQLITE_FILE = 'leads.db'
+JOURNAL_FSYNC_INTERVAL = float(os.getenv('JOURNAL_FSYNC_INTERVAL', '0.05'))  # seconds
+JOURNAL_COMPACT_INTERVAL = float(os.getenv('JOURNAL_COMPACT_INTERVAL', '60'))  # seconds
+JOURNAL_COMPACT_BYTES = int(os.getenv('JOURNAL_COMPACT_BYTES', str(4 * 1024 * 1024)))  # 4MB
+
+# OCR worker pool: uploads are processed in separate processes so they don't block the event loop
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+OCR_JOB_TIMEOUT = float(os.getenv('OCR_JOB_TIMEOUT', '120'))  # seconds per extraction job
+# 'tesserocr' keeps a loaded tesseract API in every worker, 'pytesseract' runs the tesseract CLI per call
+OCR_ENGINE = resolve_ocr_engine(os.getenv('OCR_ENGINE', 'auto'))
+# Image OCR tries these page segmentation modes and stops at the first confident, lead-yielding result
+OCR_PSM_MODES = [int(psm) for psm in os.getenv('OCR_PSM_MODES', '6,4,3,1').split(',')]
+OCR_CONFIDENCE_THRESHOLD = float(os.getenv('OCR_CONFIDENCE_THRESHOLD', '75'))
+OCR_MIN_LEADS = int(os.getenv('OCR_MIN_LEADS', '1'))
+OCR_PSM_PARALLEL = int(os.getenv('OCR_PSM_PARALLEL', '2'))  # modes of one image running at the same time
+# 'layout' assembles each lead from one spatial block of OCR words, 'text' pairs entities across the whole text
+LEAD_ASSEMBLY = os.getenv('LEAD_ASSEMBLY', 'layout')
+# Preprocessing applied once per image before OCR ('none' = the legacy RGB + upscale path)
+OCR_PREPROCESS = parse_preprocess_steps(os.getenv('OCR_PREPROCESS', 'grayscale,resize,binarize,deskew,crop'))
+OCR_TARGET_DPI = int(os.getenv('OCR_TARGET_DPI', '300'))  # photos tagged with a higher DPI are downscaled to this
+OCR_MAX_SIDE = int(os.getenv('OCR_MAX_SIDE', '2500'))  # longest side of untagged photos after downscaling
+PDF_OCR_DPI = int(os.getenv('PDF_OCR_DPI', '300'))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '5'))  # pages OCRed per scanned PDF
+PDF_TEXT_MIN_CHARS = int(os.getenv('PDF_TEXT_MIN_CHARS', '20'))  # shorter text layers get OCRed
+PDF_TEXT_BATCH_PAGES = int(os.getenv('PDF_TEXT_BATCH_PAGES', '20'))  # text layer pages read per worker job
+# Admission control, checked from file headers before anything is decoded or rasterized
+OCR_MAX_IMAGE_PIXELS = int(float(os.getenv('OCR_MAX_IMAGE_PIXELS', '100e6')))  # larger images get HTTP 413
+PDF_PAGE_LIMIT = int(os.getenv('PDF_PAGE_LIMIT', '500'))  # PDFs with more pages get HTTP 413
+PDF_PAGE_PIXEL_BUDGET = int(float(os.getenv('PDF_PAGE_PIXEL_BUDGET', '20e6')))  # larger pages are rendered below PDF_OCR_DPI
+PDF_MIN_DPI = int(os.getenv('PDF_MIN_DPI', '100'))  # pages that would need less are skipped
+UPLOAD_JOB_TIMEOUT = float(os.getenv('UPLOAD_JOB_TIMEOUT', '300'))  # wall-clock seconds per uploaded document
+# Extraction results are cached by upload content; bump the version when extraction logic changes
+EXTRACTION_CACHE_VERSION = 3
+OCR_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'ocr_cache')
+OCR_CACHE_MEMORY_MB = float(os.getenv('OCR_CACHE_MEMORY_MB', '32'))
+OCR_CACHE_DISK_MB = float(os.getenv('OCR_CACHE_DISK_MB', '512'))
+# Uploads are processed by a bounded job queue; when it is full new uploads get 429 + Retry-After
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', str(OCR_WORKERS)))
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', '20'))  # uploads waiting for a free slot
+UPLOAD_JOB_RETENTION = 1000  # finished jobs kept for polling
+UPLOAD_JOB_TTL = 3600  # seconds a finished job stays available
 
 # Create necessary directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -66,6 +169,15 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 # Gmail SMTP Configuration
 GMAIL_USER = os.getenv('GMAIL_USER', 'your-email@gmail.com')
 GMAIL_PASS = os.getenv('GMAIL_PASS', 'your-app-password')
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_SSL = os.getenv('SMTP_SSL', 'true').lower() in ('1', 'true', 'yes')  # implicit TLS (port 465)
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')  # upgrade plain connections when SMTP_SSL is off
+# Authenticated connections are kept open and reused; this many send at once
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '3'))
+SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', '60'))  # seconds before an idle connection is closed
+SMTP_NOOP_AFTER = float(os.getenv('SMTP_NOOP_AFTER', '10'))  # idle seconds after which NOOP checks a connection before reuse
+SMTP_MAX_MESSAGES = int(os.getenv('SMTP_MAX_MESSAGES', '100'))  # messages per connection before it is replaced
 
 # Pydantic Models
 class LeadBase(BaseModel):
@@ -104,204 +216,441 @@ class UploadResponse(BaseModel):
     extractedText: str
     fileInfo: Dict[str, Any]
 
-# Database operations
-def initialize_csv():
-    """Initialize CSV file if it doesn't exist"""
-    if not os.path.exists(CSV_FILE):
-        df = pd.DataFrame(columns=['id', 'name', 'email', 'phone', 'status', 'source', 'createdAt'])
-        df.to_csv(CSV_FILE, index=False)
-        logger.info(f"Created new CSV file: {CSV_FILE}")
-
-def read_leads_from_csv() -> List[Dict]:
-    """Read leads from CSV file"""
-    try:
-        if os.path.exists(CSV_FILE):
-            df = pd.read_csv(CSV_FILE)
-            df = df.fillna('')
-            return df.to_dict('records')
-        return []
-    except Exception as e:
-        logger.error(f"Error reading CSV: {e}")
-        return []
+class BulkLeadRequest(BaseModel):
+    leads: List[Dict[str, Any]]
+
+class BulkLeadResult(BaseModel):
+    index: int
+    status: str  # created | duplicate | invalid
+    email: str = ""
+    id: Optional[str] = None
+    error: Optional[str] = None
 
-def write_leads_to_csv(leads: List[Dict]) -> bool:
-    """Write leads to CSV file"""
+class BulkLeadResponse(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[BulkLeadResult]
+
+class LeadChanges(BaseModel):
+    version: int
+    resync: bool = False
+    upserted: List[Lead] = []
+    deleted: List[str] = []
+
+class UploadJob(BaseModel):
+    id: str
+    status: str  # queued | processing | completed | failed
+    createdAt: str
+    startedAt: Optional[str] = None
+    finishedAt: Optional[str] = None
+    queuePosition: Optional[int] = None
+    result: Optional[UploadResponse] = None
+    error: Optional[str] = None
+    statusCode: Optional[int] = None
+
+LEAD_LIST_ADAPTER = TypeAdapter(List[Lead])
+EMAIL_ADAPTER = TypeAdapter(EmailStr)  # the same validation as Lead.email
+
+def normalize_email(email: str) -> Optional[str]:
+    """The address as Lead would store it, or None if Lead would reject it"""
     try:
-        df = pd.DataFrame(leads)
-        df.to_csv(CSV_FILE, index=False)
-        logger.info(f"Wrote {len(leads)} leads to CSV")
-        return True
-    except Exception as e:
-        logger.error(f"Error writing CSV: {e}")
+        return EMAIL_ADAPTER.validate_python(email)
+    except ValidationError:
+        return None
+
+# Response caching
+class VersionedResponseCache:
+    """Serialized responses keyed by query, valid for a single store version.
+
+    Any mutation bumps the store version, so entries from an older version are
+    dropped wholesale on the next lookup instead of being invalidated one by one.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+
+    def get(self, version: int, key: tuple) -> Optional[Any]:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+            return None
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, version: int, key: tuple, value: Any):
+        if version != self._version:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header (possibly a list or weak tags) against an ETag"""
+    if not if_none_match:
         return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
 
-# Enhanced OCR and PDF processing functions
-async def extract_text_from_pdf_advanced(file_path: str) -> str:
-    """Extract text from PDF using multiple methods"""
-    try:
-        text = ""
-        
-        # Method 1: Try PyPDF2 first (faster)
+leads_response_cache = VersionedResponseCache(RESPONSE_CACHE_SIZE)
+
+# Live updates
+class LeadEventBroadcaster:
+    """Fans lead changes out to Server-Sent Events subscribers.
+
+    Every subscriber gets a bounded queue of pre-encoded events. When a slow
+    consumer's queue fills up its backlog is replaced by a single `resync`
+    event, so memory per subscriber stays bounded; the client then catches up
+    through /api/leads/changes.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, version: int, changed: List[Dict], deleted: List[str]):
+        """LeadStore listener; may be called from any thread"""
+        if not self._subscribers or self._loop is None:
+            return
+        if len(changed) + len(deleted) > EVENT_MAX_LEADS:
+            event = (version, self.encode('resync', version, {'version': version}))
+        else:
+            event = (version, self.encode('change', version, {
+                'version': version,
+                'upserted': changed,
+                'deleted': deleted,
+            }))
         try:
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    extracted = page.extract_text()
-                    if extracted.strip():
-                        text += extracted + "\n"
-        except Exception as e:
-            logger.warning(f"PyPDF2 extraction failed: {e}")
-        
-        # Method 2: If no text found, use pdf2image + OCR
-        if not text.strip():
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._dispatch(event)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, event)
+
+    def close(self):
+        """End every open stream"""
+        for queue in list(self._subscribers):
+            self._drain(queue)
+            queue.put_nowait(None)
+
+    @staticmethod
+    def encode(event: str, version: int, data: Dict) -> str:
+        return f"id: {version}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+    def _dispatch(self, event):
+        for queue in list(self._subscribers):
             try:
-                # Convert PDF to images
-                images = convert_from_path(file_path, dpi=300, first_page=1, last_page=5)  # Limit to first 5 pages
-                
-                for i, image in enumerate(images):
-                    # Configure tesseract for better accuracy
-                    custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz@.-+()[] '
-                    page_text = pytesseract.image_to_string(image, config=custom_config)
-                    if page_text.strip():
-                        text += f"Page {i+1}:\n{page_text}\n"
-                        
-            except Exception as e:
-                logger.error(f"pdf2image + OCR extraction failed: {e}")
-                raise HTTPException(status_code=422, detail=f"Failed to extract text from PDF: {str(e)}")
-        
-        return text
-        
-    except Exception as e:
-        logger.error(f"PDF processing error: {e}")
-        raise HTTPException(status_code=422, detail=f"Failed to process PDF: {str(e)}")
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                version = event[0]
+                self._drain(queue)
+                queue.put_nowait((version, self.encode('resync', version, {'version': version})))
 
-async def extract_text_from_image_advanced(file_path: str) -> str:
-    """Extract text from image using enhanced OCR"""
-    try:
-        image = Image.open(file_path)
-        
-        # Enhance image for better OCR
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Resize if too small
-        width, height = image.size
-        if width < 1000 or height < 1000:
-            scale_factor = max(1000/width, 1000/height)
-            new_width = int(width * scale_factor)
-            new_height = int(height * scale_factor)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Configure tesseract with multiple PSM modes for better results
-        psm_modes = [6, 4, 3, 1]  # Different page segmentation modes
-        best_text = ""
-        
-        for psm in psm_modes:
+    @staticmethod
+    def _drain(queue: asyncio.Queue):
+        while not queue.empty():
+            queue.get_nowait()
+
+lead_events = LeadEventBroadcaster(EVENT_QUEUE_SIZE)
+
+# Upload job queue
+class UploadQueueFull(Exception):
+    """Raised when an upload can't be queued; carries a Retry-After estimate in seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Upload queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class UploadJobQueue:
+    """Bounded queue of upload processing jobs drained by a fixed number of workers.
+
+    At most `concurrency` uploads are processed at once and at most
+    `max_queued` wait behind them; further submissions raise UploadQueueFull
+    instead of piling request bodies up in memory. Finished jobs stay
+    available for polling for `ttl` seconds (at most `retention` of them).
+    """
+
+    def __init__(self, concurrency: int, max_queued: int, retention: int, ttl: float):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.retention = retention
+        self.ttl = ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._average_seconds = 5.0  # moving average of processing time, for Retry-After
+
+    def start(self):
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        self._closing = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def submit(self, process: Callable[[], Awaitable[UploadResponse]]) -> Dict[str, Any]:
+        """Queue `process()`; returns the job record, whose `done` future resolves once it has finished"""
+        if self._queue is None:
+            raise UploadQueueFull(self.retry_after())
+        self._prune()
+        job = self._new_job()
+        job['process'] = process
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise UploadQueueFull(self.retry_after())
+        self._jobs[job['id']] = job
+        return job
+
+    async def submit_when_free(self, process: Callable[[], Awaitable[UploadResponse]]) -> Dict[str, Any]:
+        """Like submit, but waits for room in the queue instead of raising UploadQueueFull"""
+        if self._queue is None:
+            raise UploadQueueFull(self.retry_after())
+        self._prune()
+        job = self._new_job()
+        job['process'] = process
+        await self._queue.put(job)
+        self._jobs[job['id']] = job
+        return job
+
+    def check_capacity(self):
+        """Raise UploadQueueFull if a submit() right now would be refused"""
+        if self._queue is None or self._queue.full():
+            raise UploadQueueFull(self.retry_after())
+
+    def add_completed(self, result: UploadResponse) -> Dict[str, Any]:
+        """Record a job that needed no processing (e.g. served from the extraction cache)"""
+        self._prune()
+        job = self._new_job()
+        job.update(status='completed', startedAt=job['createdAt'], finishedAt=job['createdAt'], result=result, finished=time.monotonic())
+        job['done'].set_result(None)
+        self._jobs[job['id']] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        position = None
+        if job['status'] == 'queued':
+            position = 1
+            for other_id, other in self._jobs.items():
+                if other_id == job_id:
+                    break
+                position += other['status'] == 'queued'
+        return UploadJob(
+            id=job['id'], status=job['status'], createdAt=job['createdAt'], startedAt=job['startedAt'],
+            finishedAt=job['finishedAt'], queuePosition=position, result=job['result'],
+            error=job['error'], statusCode=job['statusCode'],
+        )
+
+    def retry_after(self) -> int:
+        waiting = self._queue.qsize() if self._queue is not None else self.max_queued
+        return max(1, min(60, math.ceil(self._average_seconds * (waiting + 1) / self.concurrency)))
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job['status'] = 'processing'
+            job['startedAt'] = datetime.now().isoformat()
+            started = time.monotonic()
             try:
-                custom_config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz@.-+()[] '
-                text = pytesseract.image_to_string(image, config=custom_config)
-                
-                # Choose the result with most content
-                if len(text.strip()) > len(best_text.strip()):
-                    best_text = text
-                    
+                job['result'] = await job.pop('process')()
+                job['status'] = 'completed'
+            except asyncio.CancelledError:
+                job.update(status='failed', error="Processing was interrupted, please retry the upload", statusCode=503)
+                # Only stop when close() cancels this worker; a CancelledError leaking out of a job must not kill it
+                if self._closing:
+                    raise
+                logger.error(f"Upload job {job['id']} was cancelled while processing")
+            except HTTPException as e:
+                job.update(status='failed', error=str(e.detail), statusCode=e.status_code)
             except Exception as e:
-                logger.warning(f"OCR with PSM {psm} failed: {e}")
-                continue
-        
-        if not best_text.strip():
-            raise HTTPException(status_code=422, detail="No text could be extracted from the image")
-            
-        return best_text
-        
+                logger.error(f"Upload job {job['id']} failed: {e}")
+                job.update(status='failed', error=f"Failed to process file: {str(e)}", statusCode=500)
+            finally:
+                job.pop('process', None)
+                job['finishedAt'] = datetime.now().isoformat()
+                job['finished'] = time.monotonic()
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * (job['finished'] - started)
+                if not job['done'].done():
+                    job['done'].set_result(None)
+                self._queue.task_done()
+
+    @staticmethod
+    def _new_job() -> Dict[str, Any]:
+        return {
+            'id': str(uuid.uuid4()),
+            'status': 'queued',
+            'createdAt': datetime.now().isoformat(),
+            'startedAt': None,
+            'finishedAt': None,
+            'result': None,
+            'error': None,
+            'statusCode': None,
+            'done': asyncio.get_running_loop().create_future(),
+        }
+
+    def _prune(self):
+        now = time.monotonic()
+        finished = [job_id for job_id, job in self._jobs.items() if 'finished' in job]
+        expired = set(finished[:max(0, len(finished) - self.retention)])
+        expired.update(job_id for job_id in finished if now - self._jobs[job_id]['finished'] > self.ttl)
+        for job_id in expired:
+            del self._jobs[job_id]
+
+upload_jobs = UploadJobQueue(UPLOAD_CONCURRENCY, UPLOAD_QUEUE_SIZE, UPLOAD_JOB_RETENTION, UPLOAD_JOB_TTL)
+
+# Database operations
+def create_lead_storage(mode: str) -> LeadStorage:
+    """Build the persistence backend selected by LEAD_STORAGE_MODE"""
+    if mode == 'csv':
+        return CSVStorage(CSV_FILE)
+    if mode == 'journal':
+        journal = LeadJournal(
+            JOURNAL_FILE,
+            fsync_interval=JOURNAL_FSYNC_INTERVAL,
+            compact_interval=JOURNAL_COMPACT_INTERVAL,
+            compact_bytes=JOURNAL_COMPACT_BYTES,
+        )
+        return JournaledCSVStorage(CSV_FILE, journal)
+    if mode == 'sqlite':
+        return SQLiteStorage(SQLITE_FILE, migrate_from=CSV_FILE)
+    raise ValueError(f"Unknown LEAD_STORAGE_MODE '{mode}', expected one of: {', '.join(STORAGE_MODES)}")
+
+lead_store = LeadStore(create_lead_storage(LEAD_STORAGE_MODE), change_log_size=CHANGE_LOG_SIZE)
+lead_store.add_listener(lead_events.publish)
+
+ocr_pool = OCRWorkerPool(OCR_WORKERS, OCR_JOB_TIMEOUT, OCR_ENGINE)
+psm_strategy = PSMStrategy(OCR_PSM_MODES, OCR_CONFIDENCE_THRESHOLD, OCR_MIN_LEADS, max_parallel=OCR_PSM_PARALLEL)
+image_preprocessor = ImagePreprocessor(PreprocessSettings(OCR_PREPROCESS, OCR_TARGET_DPI, OCR_MAX_SIDE))
+resource_guard = ResourceGuard(ResourceLimits(OCR_MAX_IMAGE_PIXELS, PDF_PAGE_LIMIT, PDF_PAGE_PIXEL_BUDGET, PDF_MIN_DPI))
+smtp_pool = SMTPConnectionPool(
+    SMTPSettings(SMTP_HOST, SMTP_PORT, SMTP_SSL, SMTP_STARTTLS, GMAIL_USER, GMAIL_PASS),
+    SMTP_POOL_SIZE, SMTP_IDLE_TIMEOUT, SMTP_NOOP_AFTER, SMTP_MAX_MESSAGES
+)
+extraction_cache = ExtractionCache(
+    OCR_CACHE_FOLDER, int(OCR_CACHE_MEMORY_MB * 1024 * 1024), int(OCR_CACHE_DISK_MB * 1024 * 1024)
+)
+# Everything besides the file content that changes extraction output
+EXTRACTION_SETTINGS = json.dumps({
+    'version': EXTRACTION_CACHE_VERSION,
+    'engine': OCR_ENGINE,
+    'whitelist': OCR_CHAR_WHITELIST,
+    'psmModes': OCR_PSM_MODES,
+    'confidenceThreshold': OCR_CONFIDENCE_THRESHOLD,
+    'minLeads': OCR_MIN_LEADS,
+    'psmParallel': OCR_PSM_PARALLEL,
+    'leadAssembly': LEAD_ASSEMBLY,
+    'preprocess': OCR_PREPROCESS,
+    'targetDpi': OCR_TARGET_DPI,
+    'maxSide': OCR_MAX_SIDE,
+    'pdfDpi': PDF_OCR_DPI,
+    'pdfMaxPages': PDF_MAX_PAGES,
+    'pdfTextMinChars': PDF_TEXT_MIN_CHARS,
+    'pdfPagePixelBudget': PDF_PAGE_PIXEL_BUDGET,
+    'pdfMinDpi': PDF_MIN_DPI,
+}, sort_keys=True)
+
+# Enhanced OCR and PDF processing functions
+@contextmanager
+def ocr_job_errors(description: str) -> Iterator[None]:
+    """Map failures of extractions running in the OCR worker pool to HTTP errors"""
+    try:
+        yield
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except OCRError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Processing the {description} took longer than {OCR_JOB_TIMEOUT:g} seconds")
     except Exception as e:
-        logger.error(f"Image OCR error: {e}")
-        raise HTTPException(status_code=422, detail=f"Failed to extract text from image: {str(e)}")
+        logger.error(f"{description} processing error: {e}")
+        raise HTTPException(status_code=422, detail=f"Failed to process {description}: {str(e)}")
+
+async def run_ocr_job(job: Awaitable[Any], description: str) -> Any:
+    """Await an extraction running in the OCR worker pool, mapping failures to HTTP errors"""
+    with ocr_job_errors(description):
+        return await job
+
+async def extract_text_from_pdf_advanced(source: DocumentSource) -> Tuple[str, List[Dict[str, Any]], List[str]]:
+    """Extract text from PDF per page: text layer where present, OCR (in parallel in the worker pool) elsewhere"""
+    return await run_ocr_job(
+        extract_text_from_pdf(
+            ocr_pool, source, PDF_OCR_DPI, PDF_MAX_PAGES, PDF_TEXT_MIN_CHARS, image_preprocessor.settings,
+            resource_guard, PDF_TEXT_BATCH_PAGES
+        ),
+        'PDF'
+    )
+
+async def extract_text_from_image_advanced(source: DocumentSource) -> Tuple[str, List[str]]:
+    """Extract text and contact blocks from image using enhanced OCR (in the OCR worker pool)"""
+    return await run_ocr_job(
+        extract_image_text_adaptive(
+            ocr_pool, psm_strategy, source, lambda text: len(extract_lead_info_advanced(text)), image_preprocessor,
+            resource_guard
+        ),
+        'image'
+    )
+
+async def extract_pages_advanced(source: DocumentSource, is_pdf: bool) -> AsyncIterator[Dict[str, Any]]:
+    """Pages of a document as they finish (see `iter_pdf_pages`); an image is a single OCRed page"""
+    with ocr_job_errors('PDF' if is_pdf else 'image'):
+        if is_pdf:
+            pages = iter_pdf_pages(
+                ocr_pool, source, PDF_OCR_DPI, PDF_MAX_PAGES, PDF_TEXT_MIN_CHARS, image_preprocessor.settings,
+                resource_guard, PDF_TEXT_BATCH_PAGES
+            )
+            try:
+                async for page in pages:
+                    yield page
+            finally:
+                await pages.aclose()
+        else:
+            start = time.perf_counter()
+            text, blocks = await extract_image_text_adaptive(
+                ocr_pool, psm_strategy, source, lambda text: len(extract_lead_info_advanced(text)), image_preprocessor,
+                resource_guard
+            )
+            yield {'page': 1, 'method': 'ocr', 'seconds': time.perf_counter() - start, 'text': text, 'blocks': blocks}
 
 def extract_lead_info_advanced(text: str) -> List[Dict[str, str]]:
-    """Enhanced lead information extraction with better regex patterns"""
+    """Enhanced lead information extraction (precompiled single-pass scanner, see extraction.py)"""
     try:
-        leads = []
-        
-        # Enhanced regex patterns
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        
-        # More comprehensive phone patterns
-        phone_patterns = [
-            r'(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})',  # US format
-            r'(?:\+?[1-9]\d{0,3}[-.\s]?)?(?:\(?(\d{1,4})\)?[-.\s]?)?(\d{1,4})[-.\s]?(\d{1,4})[-.\s]?(\d{1,9})',  # International
-            r'(\d{3})[-.\s]?(\d{3})[-.\s]?(\d{4})',  # Simple US format
-        ]
+        entities = scan_lead_entities(text)
+        counts = {kind: len({e.value for e in entities if e.kind == kind}) for kind in ('email', 'phone', 'name')}
+        logger.info(f"Enhanced extraction found: {counts['email']} emails, {counts['phone']} phones, {counts['name']} names")
         
-        # Enhanced name patterns
-        name_patterns = [
-            r'(?:^|\n|\r)([A-Z][a-z]+ [A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',  # Standard names
-            r'Name:?\s*([A-Z][a-z]+ [A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',  # With "Name:" prefix
-            r'Contact:?\s*([A-Z][a-z]+ [A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',  # With "Contact:" prefix
-        ]
-        
-        # Extract emails
-        emails = list(set(re.findall(email_pattern, text, re.IGNORECASE)))
-        
-        # Extract phones using multiple patterns
-        phones = []
-        for pattern in phone_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                if isinstance(match, tuple):
-                    phone = ''.join(match)
-                else:
-                    phone = match
-                # Clean phone number
-                clean_phone = re.sub(r'[^\d+]', '', phone)
-                if len(clean_phone) >= 10:
-                    phones.append(clean_phone)
-        phones = list(set(phones))
-        
-        # Extract names using multiple patterns
-        names = []
-        for pattern in name_patterns:
-            matches = re.findall(pattern, text, re.MULTILINE)
-            names.extend(matches)
-        names = list(set(names))
-        
-        logger.info(f"Enhanced extraction found: {len(emails)} emails, {len(phones)} phones, {len(names)} names")
-        
-        # Create leads by matching information
-        max_leads = max(len(emails), len(names), 1)
-        
-        for i in range(max_leads):
-            lead = {}
-            
-            # Assign email
-            if i < len(emails):
-                lead['email'] = emails[i]
-            elif emails:
-                lead['email'] = emails[0]
-            else:
-                continue  # Skip if no email
-            
-            # Assign name
-            if i < len(names):
-                lead['name'] = names[i]
-            elif names:
-                lead['name'] = names[0]
-            else:
-                # Try to generate name from email
-                email_name = lead['email'].split('@')[0]
-                lead['name'] = email_name.replace('.', ' ').replace('_', ' ').title()
-            
-            # Assign phone
-            if i < len(phones):
-                lead['phone'] = phones[i]
-            elif phones:
-                lead['phone'] = phones[0]
-            else:
-                lead['phone'] = ''
-            
-            if lead.get('email') and '@' in lead['email']:
-                leads.append(lead)
+        leads = assemble_leads(entities)
         
         logger.info(f"Successfully extracted {len(leads)} leads with enhanced processing")
         return leads
@@ -310,8 +659,18 @@ def extract_lead_info_advanced(text: str) -> List[Dict[str, str]]:
         logger.error(f"Enhanced lead extraction error: {e}")
         return []
 
+def extract_lead_info_layout(blocks: List[str]) -> List[Dict[str, str]]:
+    """Layout-aware lead extraction: each lead is assembled from one spatial block (e.g. one business card)"""
+    try:
+        leads = extract_leads_from_blocks(blocks)
+        logger.info(f"Layout extraction found {len(leads)} leads in {len(blocks)} blocks")
+        return leads
+    except Exception as e:
+        logger.error(f"Layout lead extraction error: {e}")
+        return []
+
 async def send_email_smtp(to_email: str, subject: str, message: str, lead_name: str) -> bool:
-    """Send email using Gmail SMTP with async support"""
+    """Send email over a pooled, already authenticated SMTP connection"""
     try:
         # Create message
         msg = MIMEMultipart()
@@ -335,17 +694,7 @@ async def send_email_smtp(to_email: str, subject: str, message: str, lead_name:
         
         msg.attach(MIMEText(html_body, 'html'))
         
-        # Send email in thread pool to avoid blocking
-        def send_email_sync():
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-                server.login(GMAIL_USER, GMAIL_PASS)
-                text = msg.as_string()
-                server.sendmail(GMAIL_USER, to_email, text)
-        
-        # Run in thread pool
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, send_email_sync)
+        await smtp_pool.send(msg, GMAIL_USER, [to_email])
         
         logger.info(f"Email sent successfully to {to_email}")
         return True
@@ -354,6 +703,25 @@ async def send_email_smtp(to_email: str, subject: str, message: str, lead_name:
         logger.error(f"Error sending email to {to_email}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
+@app.on_event("startup")
+async def load_lead_store():
+    """Load leads into the resident store once per process"""
+    lead_store.load()
+    lead_store.open()
+    lead_events.attach(asyncio.get_running_loop())
+    ocr_pool.start()
+    extraction_cache.load()
+    upload_jobs.start()
+
+@app.on_event("shutdown")
+async def close_lead_store():
+    """Close live-update streams and flush pending lead mutations into storage"""
+    lead_events.close()
+    await upload_jobs.close()
+    ocr_pool.shutdown()
+    await smtp_pool.close()
+    lead_store.close()
+
 # API Routes
 @app.get("/")
 async def root():
@@ -381,27 +749,173 @@ async def health_check():
         }
     }
 
+@app.get("/api/ocr/stats")
+async def ocr_stats():
+    """OCR tuning counters: PSM wins per document type, preprocessing cost, admission control and cache hits"""
+    return {
+        'engine': OCR_ENGINE,
+        'psmModes': OCR_PSM_MODES,
+        'confidenceThreshold': OCR_CONFIDENCE_THRESHOLD,
+        'psmWins': psm_strategy.stats(),
+        'preprocessing': image_preprocessor.stats(),
+        'admission': resource_guard.stats(),
+        'cache': extraction_cache.stats()
+    }
+
+@app.get("/api/email/stats")
+async def email_stats():
+    """SMTP pool counters: connections opened vs. reused, NOOP checks, reconnects and sends"""
+    return {
+        'host': SMTP_HOST,
+        'port': SMTP_PORT,
+        'pool': smtp_pool.stats()
+    }
+
 @app.get("/api/leads", response_model=List[Lead])
-async def get_leads():
-    """Get all leads with proper error handling"""
+async def get_leads(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    status: Optional[str] = Query(None, description="Only leads with this status"),
+    source: Optional[str] = Query(None, description="Only leads from this source"),
+    q: Optional[str] = Query(None, description="Prefix search on name or email"),
+    sort: str = Query('createdAt', pattern='^(createdAt|name)$'),
+    order: str = Query('asc', pattern='^(asc|desc)$'),
+):
+    """Get leads, optionally filtered, sorted and keyset-paginated.
+
+    Without query parameters every lead is returned in insertion order. The
+    cursor for the next page and the match count (when known) are returned in
+    the X-Next-Cursor and X-Total-Count headers. Responses carry the store
+    version as ETag; a matching If-None-Match is answered with 304.
+    """
     try:
-        logger.info('Fetching all leads...')
-        leads = read_leads_from_csv()
-        logger.info(f'Retrieved {len(leads)} leads')
-        return leads
+        version = lead_store.version
+        etag = f'"{version}"'
+        cache_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=cache_headers)
+        
+        cache_key = (limit, cursor, status, source, q, sort, order)
+        cached = leads_response_cache.get(version, cache_key)
+        if cached is None:
+            headers = {}
+            if not any((limit, cursor, status, source, q)) and sort == 'createdAt' and order == 'asc':
+                logger.info('Fetching all leads...')
+                leads = lead_store.all()
+                logger.info(f'Retrieved {len(leads)} leads')
+            else:
+                if cursor and limit is None:
+                    limit = DEFAULT_PAGE_SIZE
+                try:
+                    leads, next_cursor, total = lead_store.query(
+                        status=status, source=source, q=q, sort=sort,
+                        descending=(order == 'desc'), limit=limit, cursor=cursor
+                    )
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                
+                if next_cursor:
+                    headers['X-Next-Cursor'] = next_cursor
+                if total is not None:
+                    headers['X-Total-Count'] = str(total)
+                logger.info(f'Retrieved page of {len(leads)} leads')
+            
+            body = LEAD_LIST_ADAPTER.dump_json(LEAD_LIST_ADAPTER.validate_python(leads))
+            cached = (body, headers)
+            leads_response_cache.put(version, cache_key, cached)
+        
+        body, headers = cached
+        return Response(content=body, media_type='application/json', headers={**headers, **cache_headers})
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching leads: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch leads: {str(e)}")
 
+@app.get("/api/leads/changes", response_model=LeadChanges)
+async def get_lead_changes(since: int = Query(..., description="Store version (ETag) the client already holds")):
+    """Get leads created, updated or deleted since a store version.
+
+    If the version is older than the retained change log, `resync` is set and
+    the client should fetch the full list again.
+    """
+    changes = lead_store.changes_since(since)
+    if changes is None:
+        logger.info(f"Change log no longer covers version {since}, requesting resync")
+        return LeadChanges(version=lead_store.version, resync=True)
+    upserted, deleted, version = changes
+    return LeadChanges(version=version, upserted=upserted, deleted=deleted)
+
+@app.get("/api/leads/stream")
+async def stream_lead_events(request: Request):
+    """Server-Sent Events stream of lead changes.
+
+    `change` events carry the changed leads and deleted ids; `resync` events
+    mean the client missed changes and should call /api/leads/changes.
+    """
+    queue = lead_events.subscribe()
+    last_event_id = request.headers.get('last-event-id')
+
+    async def event_stream():
+        try:
+            # A reconnecting client that missed changes is told to catch up first
+            if last_event_id and last_event_id != str(lead_store.version):
+                yield lead_events.encode('resync', lead_store.version, {'version': lead_store.version})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event[1]
+        finally:
+            lead_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_leads_export(export_format: str) -> Iterator[str]:
+    """Serialize the lead store chunk by chunk so memory stays bounded"""
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=LEAD_COLUMNS, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        for chunk in lead_store.iter_chunks(EXPORT_CHUNK_SIZE):
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for chunk in lead_store.iter_chunks(EXPORT_CHUNK_SIZE):
+            yield ''.join(json.dumps({column: lead.get(column, '') for column in LEAD_COLUMNS}) + '\n' for lead in chunk)
+
+@app.get("/api/leads/export")
+async def export_leads(format: str = Query('ndjson', pattern='^(ndjson|csv)$')):
+    """Stream every lead as NDJSON or CSV"""
+    logger.info(f"Exporting {len(lead_store)} leads as {format}")
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        stream_leads_export(format),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="leads.{format}"'}
+    )
+
 @app.post("/api/leads", response_model=Lead)
 async def add_lead(lead: LeadCreate):
     """Add new lead"""
     try:
         # Check for duplicates
-        existing_leads = read_leads_from_csv()
-        for existing_lead in existing_leads:
-            if existing_lead.get('email', '').lower() == lead.email.lower():
-                raise HTTPException(status_code=409, detail="A lead with this email already exists")
+        if lead_store.get_by_email(lead.email):
+            raise HTTPException(status_code=409, detail="A lead with this email already exists")
         
         # Create new lead
         new_lead = {
@@ -414,9 +928,8 @@ async def add_lead(lead: LeadCreate):
             'createdAt': datetime.now().isoformat()
         }
         
-        # Add to leads list and save
-        existing_leads.append(new_lead)
-        write_leads_to_csv(existing_leads)
+        # Add to store and save
+        lead_store.add(new_lead)
         
         logger.info(f"Lead added successfully: {new_lead['id']}")
         return new_lead
@@ -427,31 +940,98 @@ async def add_lead(lead: LeadCreate):
         logger.error(f"Error adding lead: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to add lead: {str(e)}")
 
+def prepare_bulk_leads(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Normalize rows and classify each as created, duplicate or invalid in one vectorized pass"""
+    # object dtype keeps numbers as sent; a numeric column with gaps would otherwise become float ('5551234567.0')
+    df = pd.DataFrame(rows, columns=['name', 'email', 'phone', 'status', 'source'], dtype=object)
+    df = df.fillna('').astype(str).apply(lambda column: column.str.strip())
+    df['email'] = df['email'].str.lower()
+    df['status'] = df['status'].where(df['status'] != '', 'New')
+    df['source'] = df['source'].where(df['source'] != '', 'Manual')
+    df['result'] = 'created'
+    df['error'] = None
+    
+    # Anything stored must pass Lead's own validation, or every later listing would fail
+    normalized = df['email'].map(normalize_email)
+    invalid_email = normalized.isna()
+    df['email'] = normalized.where(~invalid_email, df['email'])
+    missing_name = df['name'] == ''
+    df.loc[missing_name, 'error'] = 'Name is required'
+    df.loc[invalid_email, 'error'] = 'Invalid email address'
+    invalid = invalid_email | missing_name
+    df.loc[invalid, 'result'] = 'invalid'
+    
+    # Hash lookups against the store's email index, then first-wins within the batch
+    existing = pd.Series([lead_store.get_by_email(email) is not None for email in df['email']], index=df.index, dtype=bool)
+    duplicate = ~invalid & (existing | df['email'].where(~invalid).duplicated(keep='first'))
+    df.loc[duplicate, 'result'] = 'duplicate'
+    df.loc[duplicate, 'error'] = 'A lead with this email already exists'
+    return df
+
+@app.post("/api/leads/bulk", response_model=BulkLeadResponse)
+async def add_leads_bulk(request: BulkLeadRequest):
+    """Add many leads at once with per-row results and a single save"""
+    try:
+        if len(request.leads) > MAX_BULK_LEADS:
+            raise HTTPException(status_code=413, detail=f"Too many leads. Maximum is {MAX_BULK_LEADS} per request")
+        
+        df = prepare_bulk_leads(request.leads)
+        created_at = datetime.now().isoformat()
+        to_create = df[df['result'] == 'created']
+        new_leads = [
+            {
+                'id': str(uuid.uuid4()),
+                'name': row.name,
+                'email': row.email,
+                'phone': row.phone,
+                'status': row.status,
+                'source': row.source,
+                'createdAt': created_at
+            }
+            for row in to_create.itertuples(index=False)
+        ]
+        lead_store.add_many(new_leads)
+        df['id'] = None
+        df.loc[to_create.index, 'id'] = [lead['id'] for lead in new_leads]
+        
+        results = [
+            BulkLeadResult(index=index, status=row.result, email=row.email, id=row.id, error=row.error)
+            for index, row in enumerate(df.itertuples(index=False))
+        ]
+        counts = df['result'].value_counts()
+        logger.info(f"Bulk import: {counts.get('created', 0)} created, {counts.get('duplicate', 0)} duplicates, {counts.get('invalid', 0)} invalid")
+        return BulkLeadResponse(
+            created=int(counts.get('created', 0)),
+            duplicates=int(counts.get('duplicate', 0)),
+            invalid=int(counts.get('invalid', 0)),
+            results=results
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error importing leads: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to import leads: {str(e)}")
+
 @app.put("/api/leads/{lead_id}", response_model=Lead)
 async def update_lead(lead_id: str, lead: LeadUpdate):
     """Update lead"""
     try:
-        leads = read_leads_from_csv()
-        lead_index = None
-        
-        for i, existing_lead in enumerate(leads):
-            if existing_lead.get('id') == lead_id:
-                lead_index = i
-                break
-        
-        if lead_index is None:
+        if lead_store.get(lead_id) is None:
             raise HTTPException(status_code=404, detail=f"No lead found with ID: {lead_id}")
         
         # Update lead with only provided fields
         update_data = lead.dict(exclude_unset=True)
         if 'email' in update_data:
             update_data['email'] = update_data['email'].lower()
+            existing = lead_store.get_by_email(update_data['email'])
+            if existing and existing.get('id') != lead_id:
+                raise HTTPException(status_code=409, detail="A lead with this email already exists")
         
-        leads[lead_index].update(update_data)
-        write_leads_to_csv(leads)
+        updated_lead = lead_store.update(lead_id, update_data)
         
         logger.info(f"Lead updated successfully: {lead_id}")
-        return leads[lead_index]
+        return updated_lead
         
     except HTTPException:
         raise
@@ -463,15 +1043,9 @@ async def update_lead(lead_id: str, lead: LeadUpdate):
 async def delete_lead(lead_id: str):
     """Delete lead"""
     try:
-        leads = read_leads_from_csv()
-        original_count = len(leads)
-        leads = [lead for lead in leads if lead.get('id') != lead_id]
-        
-        if len(leads) == original_count:
+        if not lead_store.delete(lead_id):
             raise HTTPException(status_code=404, detail=f"No lead found with ID: {lead_id}")
         
-        write_leads_to_csv(leads)
-        
         logger.info(f"Lead deleted successfully: {lead_id}")
         return {"message": "Lead deleted successfully"}
         
@@ -485,15 +1059,7 @@ async def delete_lead(lead_id: str):
 async def send_lead_email(lead_id: str, email_request: EmailRequest):
     """Send email to lead"""
     try:
-        leads = read_leads_from_csv()
-        lead = None
-        lead_index = None
-        
-        for i, l in enumerate(leads):
-            if l.get('id') == lead_id:
-                lead = l
-                lead_index = i
-                break
+        lead = lead_store.get(lead_id)
         
         if not lead:
             raise HTTPException(status_code=404, detail=f"No lead found with ID: {lead_id}")
@@ -506,8 +1072,7 @@ async def send_lead_email(lead_id: str, email_request: EmailRequest):
         await send_email_smtp(lead['email'], email_request.subject, email_request.message, lead['name'])
         
         # Update lead status
-        leads[lead_index]['status'] = 'Contacted'
-        write_leads_to_csv(leads)
+        lead_store.update(lead_id, {'status': 'Contacted'})
         
         logger.info(f"Email sent successfully to: {lead['email']}")
         return {"message": "Email sent successfully"}
@@ -518,46 +1083,117 @@ async def send_lead_email(lead_id: str, email_request: EmailRequest):
         logger.error(f"Error sending email: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
-@app.post("/api/upload", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...)):
-    """Upload and process file with enhanced OCR"""
-    temp_path = None
+async def read_upload(file: UploadFile, extensions: Set[str] = ALLOWED_EXTENSIONS,
+                      max_size: int = MAX_FILE_SIZE) -> Tuple[str, DocumentSource, Dict[str, Any], str]:
+    """Validate an uploaded file and read its content in chunks.
+
+    By the time this runs Starlette's multipart parser has already received
+    the whole request body into the UploadFile (kept in memory up to 1MB, in
+    an anonymous temporary file beyond that). Oversized requests that carry a
+    Content-Length never get that far (UploadSizeLimitMiddleware); for the
+    others `max_size` is enforced here, after the body has been received.
+
+    The content is hashed while it is read. Uploads up to UPLOAD_SPOOL_SIZE
+    are returned as bytes; larger ones are copied to a named temporary file,
+    since poppler reads from disk, whose path is returned instead (release it
+    with `discard_upload`). Returns (extension, content or path, file info,
+    extraction cache key).
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    
+    file_extension = file.filename.split('.')[-1].lower()
+    if file_extension not in extensions:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload PDF or image files only")
     
+    # Read file content in chunks
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    size = 0
+    chunks: List[bytes] = []
+    spooled = None
     try:
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No file uploaded")
-        
-        file_extension = file.filename.split('.')[-1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload PDF or image files only")
-        
-        # Read file content
-        contents = await file.read()
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB")
-        
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_extension}') as temp_file:
-            temp_path = temp_file.name
-            temp_file.write(contents)
-        
-        logger.info(f"Processing file: {file.filename}, Type: {file.content_type}, Size: {len(contents)} bytes")
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+            digest.update(chunk)
+            if spooled is None and size > UPLOAD_SPOOL_SIZE:
+                spooled = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_extension}')
+                chunks.append(chunk)
+                await loop.run_in_executor(None, spooled.writelines, chunks)
+                chunks = []
+            elif spooled is not None:
+                await loop.run_in_executor(None, spooled.write, chunk)
+            else:
+                chunks.append(chunk)
+    except BaseException:
+        if spooled is not None:
+            spooled.close()
+            discard_upload(spooled.name)
+        raise
+    
+    if spooled is not None:
+        spooled.close()
+        source: DocumentSource = spooled.name
+    else:
+        source = b''.join(chunks)
+    file_info = {
+        'name': file.filename,
+        'type': file.content_type,
+        'size': size
+    }
+    return file_extension, source, file_info, ExtractionCache.key(digest.hexdigest(), EXTRACTION_SETTINGS)
+
+def discard_upload(source: DocumentSource):
+    """Remove the spool file of an upload that was too large to keep in memory"""
+    if isinstance(source, str) and os.path.exists(source):
+        try:
+            os.unlink(source)
+            logger.info(f"Cleaned up temporary file: {source}")
+        except Exception as e:
+            logger.error(f"Error cleaning up file: {e}")
+
+def cached_upload_response(cache_key: str, file_info: Dict[str, Any]) -> Optional[UploadResponse]:
+    """Identical uploads (same bytes, same extraction settings) skip OCR entirely"""
+    cached = extraction_cache.get(cache_key)
+    if cached is None:
+        return None
+    logger.info(f"Extraction cache hit for {file_info['name']}")
+    file_info = dict(file_info, cached=True)
+    if cached.get('pages') is not None:
+        file_info['pages'] = cached['pages']
+    return UploadResponse(leads=cached['leads'], extractedText=cached['extractedText'], fileInfo=file_info)
+
+async def process_upload(source: DocumentSource, file_extension: str, file_info: Dict[str, Any], cache_key: str) -> UploadResponse:
+    """Extract text and leads from an uploaded file (runs as an upload job)"""
+    try:
+        logger.info(f"Processing file: {file_info['name']}, Type: {file_info['type']}, Size: {file_info['size']} bytes")
         
         # Extract text based on file type
         extracted_text = ""
-        if file.content_type == 'application/pdf' or file_extension == 'pdf':
-            extracted_text = await extract_text_from_pdf_advanced(temp_path)
-        elif file.content_type.startswith('image/') or file_extension in ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff']:
-            extracted_text = await extract_text_from_image_advanced(temp_path)
+        page_info = None
+        blocks: List[str] = []
+        if file_info['type'] == 'application/pdf' or file_extension == 'pdf':
+            extracted_text, page_info, blocks = await extract_text_from_pdf_advanced(source)
+        elif (file_info['type'] or '').startswith('image/') or file_extension in ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff']:
+            extracted_text, blocks = await extract_text_from_image_advanced(source)
         else:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.content_type}")
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_info['type']}")
         
         if not extracted_text or not extracted_text.strip():
             raise HTTPException(status_code=422, detail="No text could be extracted from the uploaded file")
         
-        # Extract lead information with enhanced processing
-        extracted_leads = extract_lead_info_advanced(extracted_text)
+        # Extract lead information with enhanced processing; falls back to the
+        # whole text when no block holds a complete contact
+        extracted_leads = []
+        if LEAD_ASSEMBLY == 'layout' and blocks:
+            extracted_leads = extract_lead_info_layout(blocks)
+        if not extracted_leads:
+            extracted_leads = extract_lead_info_advanced(extracted_text)
         
         if not extracted_leads:
             raise HTTPException(
@@ -565,38 +1201,360 @@ async def upload_file(file: UploadFile = File(...)):
                 detail="No leads found in the document",
             )
         
-        logger.info(f"Successfully extracted {len(extracted_leads)} leads from {file.filename}")
+        logger.info(f"Successfully extracted {len(extracted_leads)} leads from {file_info['name']}")
+        
+        file_info = dict(file_info)
+        if page_info is not None:
+            file_info['pages'] = page_info  # per page: text layer or OCR, and how long it took
+        
+        extracted_preview = extracted_text[:1000] + '...' if len(extracted_text) > 1000 else extracted_text
+        extraction_cache.put(cache_key, {'leads': extracted_leads, 'extractedText': extracted_preview, 'pages': page_info})
         
         return UploadResponse(
             leads=extracted_leads,
-            extractedText=extracted_text[:1000] + '...' if len(extracted_text) > 1000 else extracted_text,
-            fileInfo={
-                'name': file.filename,
-                'type': file.content_type,
-                'size': len(contents)
-            }
+            extractedText=extracted_preview,
+            fileInfo=file_info
         )
         
+    finally:
+        discard_upload(source)
+
+async def with_job_deadline(process: Awaitable[UploadResponse]) -> UploadResponse:
+    """Wall-clock limit for processing one upload; OCR jobs it still had waiting for a worker are dropped with it"""
+    try:
+        return await asyncio.wait_for(process, UPLOAD_JOB_TIMEOUT)
+    except asyncio.TimeoutError:
+        resource_guard.record('jobsTimedOut')
+        raise HTTPException(status_code=504, detail=f"Processing the file took longer than {UPLOAD_JOB_TIMEOUT:g} seconds")
+
+def upload_queue_full(error: UploadQueueFull) -> HTTPException:
+    """429 (queue full) or 503 (shutting down) with Retry-After"""
+    return HTTPException(
+        status_code=429 if upload_jobs.running else 503,
+        detail="Too many uploads are being processed, please retry later",
+        headers={'Retry-After': str(error.retry_after)}
+    )
+
+def queue_upload(source: DocumentSource, process: Callable[[], Awaitable[UploadResponse]]) -> Dict[str, Any]:
+    """Submit an upload to the job queue, answering 429 or 503 when it can't take it"""
+    try:
+        return upload_jobs.submit(lambda: with_job_deadline(process()))
+    except UploadQueueFull as e:
+        discard_upload(source)
+        raise upload_queue_full(e)
+
+async def job_result(job: Dict[str, Any]) -> UploadResponse:
+    """Wait for an upload job, raising its HTTP error if it failed"""
+    await asyncio.shield(job['done'])
+    if job['status'] == 'failed':
+        raise HTTPException(status_code=job['statusCode'], detail=job['error'])
+    return job['result']
+
+@app.post("/api/upload", response_model=UploadResponse)
+async def upload_file(file: UploadFile = File(...)):
+    """Upload and process file with enhanced OCR"""
+    try:
+        file_extension, source, file_info, cache_key = await read_upload(file)
+        cached = cached_upload_response(cache_key, file_info)
+        if cached is not None:
+            discard_upload(source)
+            return cached
+        
+        # Processed by the bounded upload queue; this request just waits for its job
+        job = queue_upload(source, lambda: process_upload(source, file_extension, file_info, cache_key))
+        return await job_result(job)
+        
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error processing file: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
+
+@app.post("/api/upload/jobs", response_model=UploadJob, status_code=202)
+async def create_upload_job(response: Response, file: UploadFile = File(...)):
+    """Queue an upload for processing and return its job id right away"""
+    try:
+        file_extension, source, file_info, cache_key = await read_upload(file)
+        cached = cached_upload_response(cache_key, file_info)
+        if cached is not None:
+            discard_upload(source)
+            job = upload_jobs.add_completed(cached)
+        else:
+            job = queue_upload(source, lambda: process_upload(source, file_extension, file_info, cache_key))
+        
+        response.headers['Location'] = f"/api/upload/jobs/{job['id']}"
+        return upload_jobs.get(job['id'])
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue upload: {str(e)}")
+
+async def stream_upload_pages(source: DocumentSource, file_extension: str, file_info: Dict[str, Any],
+                              emit: Callable[[Dict[str, Any]], None]) -> UploadResponse:
+    """Extract leads page by page (runs as an upload job), emitting an event as each page finishes.
+
+    Leads are deduplicated by email across pages as they arrive, and only a
+    preview of the text is kept, so large documents are never held in memory
+    as one string.
+    """
+    try:
+        is_pdf = file_info['type'] == 'application/pdf' or file_extension == 'pdf'
+        if not is_pdf and not ((file_info['type'] or '').startswith('image/') or file_extension in ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff']):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_info['type']}")
+        logger.info(f"Streaming file: {file_info['name']}, Type: {file_info['type']}, Size: {file_info['size']} bytes")
+
+        start = time.perf_counter()
+        seen_emails: Set[str] = set()
+        leads: List[Dict[str, str]] = []
+        page_info: List[Dict[str, Any]] = []
+        preview = ""
+        async for page in extract_pages_advanced(source, is_pdf):
+            page_leads = []
+            if LEAD_ASSEMBLY == 'layout' and page['blocks']:
+                page_leads = extract_lead_info_layout(page['blocks'])
+            if not page_leads and page['text'].strip():
+                page_leads = extract_lead_info_advanced(page['text'])
+            new_leads = []
+            for lead in page_leads:
+                email = lead['email'].lower()
+                if email not in seen_emails:
+                    seen_emails.add(email)
+                    new_leads.append(lead)
+            leads.extend(new_leads)
+            if len(preview) < 1000 and page['text'].strip():
+                preview += page['text'].strip() + "\n"
+            info = {'page': page['page'], 'method': page['method'], 'ms': round(page['seconds'] * 1000, 1)}
+            page_info.append(info)
+            emit(dict(info, type='page', chars=len(page['text'].strip()), blocks=sum(1 for block in page['blocks'] if block.strip()),
+                      leads=new_leads, duplicates=len(page_leads) - len(new_leads), totalLeads=len(leads),
+                      elapsedMs=round((time.perf_counter() - start) * 1000, 1)))
+
+        if not preview:
+            raise HTTPException(status_code=422, detail="No text could be extracted from the uploaded file")
+        if not leads:
+            raise HTTPException(status_code=422, detail="No leads found in the document")
+        logger.info(f"Successfully streamed {len(leads)} leads from {file_info['name']}")
+
+        file_info = dict(file_info, pages=sorted(page_info, key=lambda info: info['page']))
+        response = UploadResponse(
+            leads=leads,
+            extractedText=preview[:1000] + '...' if len(preview) > 1000 else preview,
+            fileInfo=file_info
+        )
+        emit({'type': 'summary', 'leads': leads, 'totalLeads': len(leads), 'fileInfo': file_info,
+              'ms': round((time.perf_counter() - start) * 1000, 1)})
+        return response
+
     finally:
-        # Clean up temporary file
-        if temp_path and os.path.exists(temp_path):
+        discard_upload(source)
+
+@app.post("/api/upload/stream")
+async def upload_file_stream(file: UploadFile = File(...)):
+    """Upload a document and stream NDJSON events while it is processed.
+
+    The first line reports the queued job (its id can also be polled via
+    /api/upload/jobs/{id}), then one line follows per page as soon as that
+    page is done: method, timing, text size and the leads not seen on earlier
+    pages. The last line is a summary with all leads, or an error.
+    """
+    try:
+        file_extension, source, file_info, cache_key = await read_upload(file)
+        cached = cached_upload_response(cache_key, file_info)
+        if cached is not None:
+            discard_upload(source)
+            summary = {'type': 'summary', 'leads': cached.leads, 'totalLeads': len(cached.leads), 'fileInfo': cached.fileInfo}
+            return StreamingResponse(iter([json.dumps(summary) + '\n']), media_type='application/x-ndjson')
+
+        events: asyncio.Queue = asyncio.Queue()
+        job = queue_upload(source, lambda: stream_upload_pages(source, file_extension, file_info, events.put_nowait))
+        return StreamingResponse(stream_upload_events(job, events), media_type='application/x-ndjson')
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming file: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
+
+async def stream_upload_events(job: Dict[str, Any], events: asyncio.Queue):
+    # A disconnecting client only stops this stream; the job finishes and stays pollable
+    queued = upload_jobs.get(job['id'])
+    yield json.dumps({'type': 'queued', 'jobId': job['id'], 'queuePosition': queued.queuePosition if queued else None}) + '\n'
+    while True:
+        next_event = asyncio.ensure_future(events.get())
+        await asyncio.wait({next_event, job['done']}, return_when=asyncio.FIRST_COMPLETED)
+        if not next_event.done():
+            next_event.cancel()
+            break
+        yield json.dumps(next_event.result()) + '\n'
+    while not events.empty():
+        yield json.dumps(events.get_nowait()) + '\n'
+    if job['status'] == 'failed':
+        yield json.dumps({'type': 'error', 'error': job['error'], 'statusCode': job['statusCode']}) + '\n'
+
+@app.get("/api/upload/jobs/{job_id}", response_model=UploadJob)
+async def get_upload_job(job_id: str):
+    """Poll an upload job for its status and, once completed, its result"""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+def batch_documents(files: List[UploadFile], archives: List[zipfile.ZipFile]) -> List[Tuple[str, Callable[[], Awaitable]]]:
+    """List the documents of a batch as (name, loader) pairs; loaders read the content only when called"""
+    documents = []
+    for file in files:
+        if (file.filename or '').lower().endswith('.zip'):
+            archive = archives.pop(0)
+            for entry in archive.infolist():
+                entry_name = entry.filename.rsplit('/', 1)[-1]
+                if entry.is_dir() or not entry_name or entry_name.startswith('.') or entry.filename.startswith('__MACOSX/'):
+                    continue
+                documents.append((f"{file.filename}/{entry.filename}", partial(read_archive_entry, archive, entry)))
+        else:
+            documents.append((file.filename or '', partial(read_upload, file)))
+    return documents
+
+async def read_archive_entry(archive: zipfile.ZipFile, entry: zipfile.ZipInfo) -> Tuple[str, DocumentSource, Dict[str, Any], str]:
+    """Validate and read one document from an uploaded ZIP archive (same result as `read_upload`)"""
+    file_extension = entry.filename.split('.')[-1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload PDF or image files only")
+    if entry.file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB")
+    contents = await asyncio.get_running_loop().run_in_executor(None, archive.read, entry)
+    file_info = {
+        'name': entry.filename,
+        'type': mimetypes.guess_type(entry.filename)[0] or 'application/octet-stream',
+        'size': len(contents)
+    }
+    return file_extension, contents, file_info, ExtractionCache.key(hashlib.sha256(contents).hexdigest(), EXTRACTION_SETTINGS)
+
+@app.post("/api/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """Process several documents and/or ZIP archives, streaming one NDJSON result per document as it finishes.
+
+    Documents are processed by the shared upload job queue, at most
+    UPLOAD_CONCURRENCY of a batch queued at a time, so batches and single
+    uploads share one concurrency limit; a batch arriving while the queue is
+    full gets 429. Identical files are processed once, and a lead whose email
+    already came out of an earlier document in the batch is reported as a
+    duplicate. The last line is a summary.
+    """
+    try:
+        upload_jobs.check_capacity()
+    except UploadQueueFull as e:
+        raise upload_queue_full(e)
+    archives: List[zipfile.ZipFile] = []
+    archive_sources: List[DocumentSource] = []
+    try:
+        for file in files:
+            if (file.filename or '').lower().endswith('.zip'):
+                _, source, _, _ = await read_upload(file, extensions={'zip'}, max_size=MAX_BATCH_SIZE)
+                archive_sources.append(source)
+                archives.append(zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source))
+        documents = batch_documents(files, list(archives))
+    except zipfile.BadZipFile:
+        close_batch(archives, archive_sources)
+        raise HTTPException(status_code=400, detail="Invalid ZIP archive")
+    except BaseException:
+        close_batch(archives, archive_sources)
+        raise
+    if not documents:
+        close_batch(archives, archive_sources)
+        raise HTTPException(status_code=400, detail="No documents found in the upload")
+    if len(documents) > MAX_BATCH_FILES:
+        close_batch(archives, archive_sources)
+        raise HTTPException(status_code=413, detail=f"Too many documents. A batch may contain at most {MAX_BATCH_FILES}")
+    
+    logger.info(f"Processing batch of {len(documents)} documents")
+    return StreamingResponse(
+        stream_batch_results(documents, archives, archive_sources),
+        media_type='application/x-ndjson'
+    )
+
+async def stream_batch_results(documents: List[Tuple[str, Callable[[], Awaitable]]], archives: List[zipfile.ZipFile],
+                               archive_sources: List[DocumentSource]):
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    processed: Dict[str, asyncio.Future] = {}  # cache key -> first processing of that content in this batch
+
+    async def process_document(index: int, name: str, load: Callable[[], Awaitable]) -> Dict[str, Any]:
+        result = {'type': 'file', 'index': index, 'name': name}
+        async with semaphore:
             try:
-                os.unlink(temp_path)
-                logger.info(f"Cleaned up temporary file: {temp_path}")
+                file_extension, source, file_info, cache_key = await load()
+                response = cached_upload_response(cache_key, file_info)
+                if response is not None:
+                    discard_upload(source)
+                elif cache_key in processed:
+                    discard_upload(source)
+                    response = await processed[cache_key]
+                    result['duplicateFile'] = True
+                else:
+                    # Through the shared job queue, waiting for room rather than failing the document
+                    try:
+                        job = await upload_jobs.submit_when_free(
+                            lambda: with_job_deadline(process_upload(source, file_extension, file_info, cache_key))
+                        )
+                    except UploadQueueFull as e:
+                        discard_upload(source)
+                        raise upload_queue_full(e)
+                    except asyncio.CancelledError:
+                        discard_upload(source)
+                        raise
+                    processed[cache_key] = asyncio.ensure_future(job_result(job))
+                    response = await processed[cache_key]
+                result.update(status='completed', leads=response.leads, fileInfo=response.fileInfo)
+            except HTTPException as e:
+                result.update(status='failed', error=str(e.detail), statusCode=e.status_code)
             except Exception as e:
-                logger.error(f"Error cleaning up file: {e}")
+                logger.error(f"Batch document {name} failed: {e}")
+                result.update(status='failed', error=f"Failed to process file: {str(e)}", statusCode=500)
+        return result
+
+    tasks = [asyncio.create_task(process_document(i, name, load)) for i, (name, load) in enumerate(documents)]
+    seen_emails: Set[str] = set()
+    summary = {'type': 'summary', 'files': len(documents), 'completed': 0, 'failed': 0, 'leads': 0, 'duplicates': 0}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result['status'] == 'completed':
+                unique, duplicates = [], 0
+                for lead in result['leads']:
+                    email = lead.get('email', '').lower()
+                    if email and email in seen_emails:
+                        duplicates += 1
+                        continue
+                    seen_emails.add(email)
+                    unique.append(lead)
+                result.update(leads=unique, duplicates=duplicates)
+                summary['completed'] += 1
+                summary['leads'] += len(unique)
+                summary['duplicates'] += duplicates
+            else:
+                summary['failed'] += 1
+            yield json.dumps(result) + '\n'
+        logger.info(f"Batch finished: {summary['completed']} documents, {summary['leads']} leads, {summary['duplicates']} duplicates")
+        yield json.dumps(summary) + '\n'
+    finally:
+        # Also reached when the client disconnects: stop the remaining work
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        close_batch(archives, archive_sources)
+
+def close_batch(archives: List[zipfile.ZipFile], archive_sources: List[DocumentSource]):
+    for archive in archives:
+        archive.close()
+    for source in archive_sources:
+        discard_upload(source)
 
 @app.post("/api/workflow/execute")
 async def execute_workflow(workflow: WorkflowRequest):
     """Execute workflow automation"""
     try:
-        leads = read_leads_from_csv()
-        target_leads = [lead for lead in leads if lead.get('id') in workflow.leadIds]
+        target_leads = [lead for lead in (lead_store.get(lead_id) for lead_id in dict.fromkeys(workflow.leadIds)) if lead]
         
         if not target_leads:
             raise HTTPException(status_code=404, detail="None of the specified leads were found")
@@ -611,7 +1569,7 @@ async def execute_workflow(workflow: WorkflowRequest):
             if GMAIL_USER == 'your-email@gmail.com' or GMAIL_PASS == 'your-app-password':
                 raise HTTPException(status_code=500, detail="Email service is not configured")
             
-            # Send emails concurrently (but limit concurrency to avoid overwhelming SMTP)
+            # Send emails concurrently; the SMTP pool bounds how many are in flight
             async def send_single_email(lead):
                 try:
                     subject = workflow.emailTemplate['subject'].replace('{{name}}', lead['name'])
@@ -621,24 +1579,18 @@ async def execute_workflow(workflow: WorkflowRequest):
                 except Exception as e:
                     return {'leadId': lead['id'], 'status': 'failed', 'error': str(e)}
             
-            # Process emails in batches to avoid overwhelming the SMTP server
-            batch_size = 3
-            for i in range(0, len(target_leads), batch_size):
-                batch = target_leads[i:i+batch_size]
-                batch_results = await asyncio.gather(*[send_single_email(lead) for lead in batch])
-                results.extend(batch_results)
-                
-                # Small delay between batches
-                if i + batch_size < len(target_leads):
-                    await asyncio.sleep(1)
+            results.extend(await asyncio.gather(*[send_single_email(lead) for lead in target_leads]))
         
         elif workflow.action == 'update_status':
             new_status = workflow.status or 'Contacted'
-            for i, lead in enumerate(leads):
-                if lead.get('id') in workflow.leadIds:
-                    leads[i]['status'] = new_status
-            write_leads_to_csv(leads)
-            results.append({'action': 'status_updated', 'count': len(target_leads), 'newStatus': new_status})
+            outcomes = lead_store.update_many(workflow.leadIds, {'status': new_status})
+            results.append({
+                'action': 'status_updated',
+                'count': len(target_leads),
+                'newStatus': new_status,
+                'updated': sum(1 for outcome in outcomes.values() if outcome == 'updated'),
+                'outcomes': outcomes
+            })
         
         else:
             raise HTTPException(status_code=400, detail=f"Action '{workflow.action}' is not supported")
@@ -657,12 +1609,16 @@ async def execute_workflow(workflow: WorkflowRequest):
         raise HTTPException(status_code=500, detail=f"Failed to execute workflow: {str(e)}")
 
 if __name__ == "__main__":
-    # Initialize CSV file
-    initialize_csv()
+    parser = argparse.ArgumentParser(description="Lead Management FastAPI server")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default=LEAD_STORAGE_MODE,
+                        help="lead storage backend (overrides LEAD_STORAGE_MODE)")
+    args = parser.parse_args()
+    # The reloader imports main:app in a fresh process, so pass the choice via the environment
+    os.environ['LEAD_STORAGE_MODE'] = args.storage
     
     logger.info("🚀 Starting Lead Management FastAPI...")
-    logger.info(f"📊 CSV file: {CSV_FILE}")
-    logger.info(f"📧 Gmail SMTP: {GMAIL_USER}")
+    logger.info(f"📊 Lead storage: {args.storage} ({SQLITE_FILE if args.storage == 'sqlite' else CSV_FILE})")
+    logger.info(f"📧 SMTP: {GMAIL_USER} via {SMTP_HOST}:{SMTP_PORT} (pool of {SMTP_POOL_SIZE})")
     logger.info("✅ Server ready to accept connections!")
     
     import uvicorn
@@ -0,0 +1,946 @@
+"""
+OCR and PDF text extraction, executed in a dedicated process pool
+"""
+import asyncio
+from collections import OrderedDict, deque
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+import tempfile
+import time
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageFilter, ImageOps
+from pdf2image import convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+import PyPDF2
+
+from extraction import OCRWord, group_contact_blocks
+
+logger = logging.getLogger(__name__)
+
+OCR_CHAR_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz@.-+()[] '
+
+# Documents are passed around either as in-memory bytes (small uploads) or as a file path (spooled uploads)
+DocumentSource = Union[bytes, str]
+
+class OCRError(Exception):
+    """Raised by extraction jobs when a document yields no usable text"""
+
+class DocumentTooLarge(OCRError):
+    """Raised before decoding when a document exceeds the resource limits"""
+
+def open_source(source: DocumentSource) -> Union[io.BytesIO, str]:
+    """Something PyPDF2 and PIL can open: a buffer over in-memory bytes, or the path itself"""
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+# Admission control
+class ResourceLimits(NamedTuple):
+    """Size limits checked from document headers, before anything is decoded or rasterized"""
+    max_image_pixels: int = 100_000_000  # larger images are rejected
+    max_pdf_pages: int = 500  # PDFs with more pages are rejected
+    page_pixel_budget: int = 20_000_000  # PDF pages are rendered at a lower DPI to stay within this
+    min_pdf_dpi: int = 100  # pages that would need a lower DPI than this are skipped
+
+class ResourceGuard:
+    """Applies ResourceLimits to incoming documents and counts what it admitted, downgraded or rejected"""
+
+    def __init__(self, limits: ResourceLimits):
+        self.limits = limits
+        self.counters = {
+            'imagesAdmitted': 0, 'imagesRejected': 0, 'pdfsAdmitted': 0, 'pdfsRejected': 0,
+            'pagesDownscaled': 0, 'pagesSkipped': 0, 'jobsTimedOut': 0,
+        }
+
+    def record(self, counter: str):
+        self.counters[counter] += 1
+
+    def check_image(self, source: DocumentSource) -> Tuple[int, int]:
+        """Image dimensions from the header; raises DocumentTooLarge over the pixel limit"""
+        limit = f"limit {self.limits.max_image_pixels / 1_000_000:g} megapixels"
+        try:
+            with Image.open(open_source(source)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            # Pillow refuses to even open images far beyond its own pixel limit
+            self.record('imagesRejected')
+            raise DocumentTooLarge(f"Image is too large ({limit})")
+        if width * height > self.limits.max_image_pixels:
+            self.record('imagesRejected')
+            raise DocumentTooLarge(f"Image is too large: {width}x{height} pixels ({limit})")
+        self.record('imagesAdmitted')
+        return width, height
+
+    def page_dpi(self, size: Optional[Tuple[float, float]], dpi: int) -> Optional[int]:
+        """DPI to rasterize a page of `size` points at: `dpi` if it fits the pixel budget, lower if not,
+        None (skip the page) if it would have to drop below the minimum DPI"""
+        if size is None:
+            return dpi
+        square_inches = (size[0] / 72) * (size[1] / 72)
+        if square_inches * dpi * dpi <= self.limits.page_pixel_budget:
+            return dpi
+        fitted = int(math.sqrt(self.limits.page_pixel_budget / square_inches))
+        if fitted < self.limits.min_pdf_dpi:
+            self.record('pagesSkipped')
+            return None
+        self.record('pagesDownscaled')
+        return fitted
+
+    def stats(self) -> Dict[str, Any]:
+        limits = self.limits
+        return dict(self.counters, limits={
+            'maxImagePixels': limits.max_image_pixels, 'maxPdfPages': limits.max_pdf_pages,
+            'pagePixelBudget': limits.page_pixel_budget, 'minPdfDpi': limits.min_pdf_dpi,
+        })
+
+# Extraction jobs (run inside worker processes)
+PDFPageLayer = Tuple[str, float, Optional[Tuple[float, float]]]  # text, seconds, page size in points
+
+def pdf_page_size(info: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """Page size in points from pdfinfo output ("612 x 792 pts (letter)")"""
+    try:
+        width, _, height = str(info['Page size']).split()[:3]
+        return float(width), float(height)
+    except (KeyError, ValueError):
+        return None
+
+def pdf_info(source: DocumentSource) -> Dict[str, Any]:
+    """poppler's pdfinfo for a PDF on disk or in memory"""
+    return pdfinfo_from_bytes(source) if isinstance(source, bytes) else pdfinfo_from_path(source)
+
+# The last PDF this worker parsed: the text layer is read in page ranges, and ranges of the
+# same file that land on the same worker skip re-parsing its cross-reference table
+_pdf_reader: Optional[Tuple[Tuple[str, int, float], PyPDF2.PdfReader]] = None
+
+def pdf_reader(source: DocumentSource) -> PyPDF2.PdfReader:
+    """A PdfReader for `source`, reused across jobs on this worker while the file on disk is unchanged"""
+    global _pdf_reader
+    if isinstance(source, bytes):
+        return PyPDF2.PdfReader(io.BytesIO(source))
+    stat = os.stat(source)
+    key = (os.path.abspath(source), stat.st_size, stat.st_mtime)
+    if _pdf_reader is None or _pdf_reader[0] != key:
+        _pdf_reader = None  # release the previous document before parsing the next
+        _pdf_reader = (key, PyPDF2.PdfReader(source))
+    return _pdf_reader[1]
+
+def pdf_page_count(source: DocumentSource, max_pages: Optional[int] = None) -> int:
+    """Number of pages from the PDF's page tree, or from poppler if PyPDF2 can't parse the file.
+
+    Raises DocumentTooLarge, before reading any page, if the PDF has more than `max_pages` pages.
+    """
+    count = 0
+    try:
+        count = len(pdf_reader(source).pages)
+    except Exception as e:
+        logger.warning(f"PyPDF2 could not read the page tree: {e}")
+    if not count:
+        try:
+            count = int(pdf_info(source).get('Pages', 0))
+        except Exception as e:
+            raise OCRError(f"Failed to extract text from PDF: {str(e)}")
+    if max_pages is not None and count > max_pages:
+        raise DocumentTooLarge(f"PDF has {count} pages (limit {max_pages})")
+    return count
+
+def extract_pdf_text_layer(source: DocumentSource, first_page: int, last_page: int) -> List[PDFPageLayer]:
+    """Extract the embedded text layer of pages `first_page`..`last_page` (1-based, inclusive) with PyPDF2.
+
+    Returns (text, seconds, page size) per page; pages PyPDF2 can't read come back empty, so they get OCRed.
+    """
+    pages = []
+    try:
+        reader = pdf_reader(source)
+        for index in range(first_page - 1, min(last_page, len(reader.pages))):
+            start = time.perf_counter()
+            page = reader.pages[index]
+            try:
+                extracted = page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"PyPDF2 extraction failed on page {index + 1}: {e}")
+                extracted = ""
+            try:
+                size = (float(page.mediabox.width), float(page.mediabox.height))
+            except Exception:
+                size = None
+            pages.append((extracted, time.perf_counter() - start, size))
+    except Exception as e:
+        logger.warning(f"PyPDF2 extraction failed: {e}")
+    missing = last_page - first_page + 1 - len(pages)
+    if missing > 0:
+        # PyPDF2 could not parse the file; take the page size from poppler
+        try:
+            size = pdf_page_size(pdf_info(source))
+        except Exception:
+            size = None
+        pages.extend([("", 0.0, size)] * missing)
+    return pages
+
+def ocr_pdf_page(file_path: str, page_number: int, dpi: int,
+                 settings: 'PreprocessSettings') -> Tuple[int, str, float, List[str]]:
+    """Rasterize and OCR a single PDF page; only this page's bitmap is ever held in memory.
+
+    Returns (page number, text, seconds, contact blocks).
+    """
+    start = time.perf_counter()
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number,
+                               grayscale='grayscale' in settings.steps)
+    text, blocks = "", []
+    try:
+        if images:
+            # Already rendered at the target DPI, so only the bilevel/deskew/crop steps apply
+            page_settings = settings._replace(steps=tuple(step for step in settings.steps if step != 'resize'))
+            page_image = preprocess_image(images[0], page_settings)[0] if page_settings.steps else images[0]
+            data = ocr_engine().image_to_data(page_image, 6)
+            text, _ = ocr_data_to_text(data)
+            blocks = group_contact_blocks(ocr_data_words(data))
+    finally:
+        for image in images:
+            image.close()
+    return page_number, text, time.perf_counter() - start, blocks
+
+def load_image_for_ocr(source: DocumentSource) -> Image.Image:
+    """Open an image and prepare it for tesseract"""
+    image = Image.open(open_source(source))
+
+    # Enhance image for better OCR
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # Resize if too small
+    width, height = image.size
+    if width < 1000 or height < 1000:
+        scale_factor = max(1000/width, 1000/height)
+        new_width = int(width * scale_factor)
+        new_height = int(height * scale_factor)
+        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    return image
+
+# Image preprocessing
+PREPROCESS_STEPS = ('grayscale', 'resize', 'binarize', 'deskew', 'crop')
+
+class PreprocessSettings(NamedTuple):
+    """Which preprocessing steps run before OCR; no steps means the legacy RGB + upscale path"""
+    steps: Tuple[str, ...] = PREPROCESS_STEPS
+    target_dpi: int = 300  # photos whose metadata claims a higher DPI are downscaled to this
+    max_side: int = 2500  # longest side after resizing, for photos without DPI metadata
+    min_side: int = 1000  # small images are upscaled until both sides reach this
+    max_skew: float = 5.0  # degrees searched in each direction by deskew
+
+def parse_preprocess_steps(value: str) -> Tuple[str, ...]:
+    """Steps from a comma separated setting; 'none' (or empty) keeps the legacy path"""
+    steps = tuple(step.strip().lower() for step in value.split(',') if step.strip())
+    if steps in ((), ('none',)):
+        return ()
+    unknown = [step for step in steps if step not in PREPROCESS_STEPS]
+    if unknown:
+        raise ValueError(f"Unknown preprocessing steps {unknown}, expected some of: {', '.join(PREPROCESS_STEPS)}")
+    return steps
+
+# A decoded image as passed between worker processes: (mode, size, raw pixels)
+PreparedImage = Tuple[str, Tuple[int, int], bytes]
+
+def binarize_image(image: Image.Image, offset: int = 12) -> Image.Image:
+    """Bilevel image: pixels clearly darker than their neighbourhood become black ink, the rest white.
+
+    A local threshold copes with shadows, coloured card stock and a card lying on
+    a darker table, where one global threshold would black out whole regions.
+    Light text on a dark background comes out as outlined letters, which
+    tesseract's inverted-line pass still reads.
+    """
+    radius = max(8, min(image.size) // 40)
+    pixels = np.asarray(image, dtype=np.int16)
+    local_mean = np.asarray(image.filter(ImageFilter.BoxBlur(radius)), dtype=np.int16)
+    return Image.fromarray(np.where(pixels < local_mean - offset, 0, 255).astype(np.uint8))
+
+def estimate_skew(binary: Image.Image, max_angle: float, step: float = 0.5) -> float:
+    """Rotation (degrees) that makes text rows horizontal, by maximizing the row projection contrast"""
+    sample = ImageOps.invert(binary)  # ink becomes white, so rotation fill doesn't add ink
+    sample.thumbnail((800, 800))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rows = np.asarray(sample.rotate(float(angle), resample=Image.Resampling.NEAREST), dtype=np.float32).sum(axis=1)
+        score = float(np.square(np.diff(rows)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def resize_scale(image: Image.Image, settings: PreprocessSettings) -> float:
+    """Factor the resize step scales `image` by (1.0 = unchanged)"""
+    dpi = image.info.get('dpi', (0, 0))[0] or 0
+    longest, shortest = max(image.size), min(image.size)
+    if dpi > settings.target_dpi:
+        return settings.target_dpi / dpi
+    if longest > settings.max_side:
+        return settings.max_side / longest
+    if shortest < settings.min_side:
+        return min(settings.min_side / shortest, settings.max_side / longest)
+    return 1.0
+
+def preprocess_image(image: Image.Image, settings: PreprocessSettings) -> Tuple[Image.Image, Dict[str, Any]]:
+    """Shrink an image to what tesseract needs: one channel, bilevel, straight and cropped to the text.
+
+    Returns the processed image and stats (milliseconds per step, pixel counts, skew).
+    """
+    stats: Dict[str, Any] = {'inputPixels': image.width * image.height, 'ms': {}}
+    steps = settings.steps
+
+    def timed(step: str, func: Callable[[Image.Image], Image.Image]) -> Image.Image:
+        start = time.perf_counter()
+        result = func(image)
+        stats['ms'][step] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    if 'grayscale' in steps:
+        image = timed('grayscale', lambda im: im.convert('L'))
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if 'resize' in steps:
+        def resize(im: Image.Image) -> Image.Image:
+            scale = resize_scale(im, settings)
+            if scale == 1.0:
+                return im
+            size = (max(1, int(im.width * scale)), max(1, int(im.height * scale)))
+            # reducing_gap shrinks large photos with a cheap integer reduce before the LANCZOS pass
+            return im.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0 if scale < 1 else None)
+        image = timed('resize', resize)
+
+    if 'binarize' in steps and image.mode == 'L':
+        image = timed('binarize', binarize_image)
+
+        if 'deskew' in steps:
+            def deskew(im: Image.Image) -> Image.Image:
+                stats['skew'] = estimate_skew(im, settings.max_skew)
+                if abs(stats['skew']) < 0.5:
+                    return im
+                return im.rotate(stats['skew'], resample=Image.Resampling.NEAREST, expand=True, fillcolor=255)
+            image = timed('deskew', deskew)
+
+        if 'crop' in steps:
+            def crop(im: Image.Image) -> Image.Image:
+                bbox = ImageOps.invert(im).getbbox()
+                if not bbox:
+                    return im
+                margin = max(10, min(im.size) // 50)
+                return im.crop((max(0, bbox[0] - margin), max(0, bbox[1] - margin),
+                                min(im.width, bbox[2] + margin), min(im.height, bbox[3] + margin)))
+            image = timed('crop', crop)
+        image = image.convert('1', dither=Image.Dither.NONE)  # 1 bit per pixel for transfer and tesseract
+
+    stats['outputPixels'] = image.width * image.height
+    return image, stats
+
+def prepare_image(source: DocumentSource, settings: PreprocessSettings) -> Tuple[PreparedImage, Dict[str, Any]]:
+    """Decode and preprocess an uploaded image once, for every OCR attempt on it"""
+    if settings.steps:
+        with Image.open(open_source(source)) as original:
+            input_pixels = original.width * original.height
+            scale = resize_scale(original, settings) if 'resize' in settings.steps else 1.0
+            if original.format == 'JPEG' and scale <= 0.5:
+                # Let the JPEG decoder skip detail we'd throw away anyway (decodes at 1/2, 1/4 or 1/8 size)
+                width = original.width
+                original.draft('L' if 'grayscale' in settings.steps else 'RGB',
+                               (int(original.width * scale), int(original.height * scale)))
+                if 'dpi' in original.info:
+                    original.info['dpi'] = tuple(d * original.width / width for d in original.info['dpi'])
+            image, stats = preprocess_image(ImageOps.exif_transpose(original), settings)
+            stats['inputPixels'] = input_pixels
+    else:
+        start = time.perf_counter()
+        image = load_image_for_ocr(source)
+        stats = {'inputPixels': None, 'outputPixels': image.width * image.height,
+                 'ms': {'legacy': round((time.perf_counter() - start) * 1000, 1)}}
+    return (image.mode, image.size, image.tobytes()), stats
+
+class ImagePreprocessor:
+    """Preprocessing settings plus running totals of what preprocessing costs and saves"""
+
+    def __init__(self, settings: PreprocessSettings):
+        self.settings = settings
+        self.images = 0
+        self.input_pixels = 0
+        self.output_pixels = 0
+        self.step_ms: Dict[str, float] = {}
+
+    def record(self, stats: Dict[str, Any]):
+        self.images += 1
+        self.input_pixels += stats['inputPixels'] or stats['outputPixels']
+        self.output_pixels += stats['outputPixels']
+        for step, ms in stats['ms'].items():
+            self.step_ms[step] = self.step_ms.get(step, 0.0) + ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'steps': list(self.settings.steps),
+            'images': self.images,
+            'pixelReduction': round(1 - self.output_pixels / self.input_pixels, 3) if self.input_pixels else 0.0,
+            'meanStepMs': {step: round(ms / self.images, 1) for step, ms in self.step_ms.items()},
+        }
+
+def ocr_data_to_text(data: Dict[str, List]) -> Tuple[str, float]:
+    """Rebuild text from tesseract `image_to_data` output and compute its mean word confidence"""
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        word = str(word).strip()
+        if not word:
+            continue
+        lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(word)
+        confidence = float(data['conf'][i])
+        if confidence >= 0:
+            confidences.append(confidence)
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+def ocr_data_words(data: Dict[str, List]) -> List[OCRWord]:
+    """Words with their bounding boxes from tesseract `image_to_data` output"""
+    line_ids: Dict[Tuple[int, int, int], int] = {}
+    words = []
+    for i, word in enumerate(data['text']):
+        word = str(word).strip()
+        if not word:
+            continue
+        line = line_ids.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), len(line_ids))
+        words.append(OCRWord(word, int(data['left'][i]), int(data['top'][i]), int(data['width'][i]), int(data['height'][i]), line))
+    return words
+
+def ocr_image_with_psm(prepared: PreparedImage, psm: int) -> Tuple[int, str, float, List[str]]:
+    """OCR a prepared image with one page segmentation mode; returns (psm, text, mean confidence, contact blocks)"""
+    image = Image.frombytes(*prepared)
+    # One tesseract pass gives both the text and the word boxes used for layout-aware lead assembly
+    data = ocr_engine().image_to_data(image, psm)
+    text, confidence = ocr_data_to_text(data)
+    return psm, text, confidence, group_contact_blocks(ocr_data_words(data))
+
+# PSM strategy
+def classify_document(source: DocumentSource) -> str:
+    """Cheap document type from the image header (no pixel decoding)"""
+    with Image.open(open_source(source)) as image:
+        width, height = image.size
+    ratio = max(width, height) / max(1, min(width, height))
+    if width >= height and 1.4 <= ratio <= 2.0 and width < 2500:
+        return 'card'
+    if height > width and 1.2 <= ratio <= 1.6:
+        return 'page'
+    return 'photo' if width * height >= 4_000_000 else 'other'
+
+class PSMStrategy:
+    """Chooses which tesseract page segmentation modes to run for an image.
+
+    Candidate modes are tried in learned order, at most `max_parallel` at a
+    time in the OCR pool, and the first result whose mean confidence and lead
+    yield clear the thresholds wins; modes not started yet never run, while
+    attempts already running finish in their worker and are discarded. Wins
+    are counted per document type, and once one mode wins at least
+    `dominance` of `min_samples` or more images it runs alone first, with the
+    other modes only as a fallback.
+    """
+
+    def __init__(self, modes: List[int], confidence_threshold: float, min_leads: int,
+                 min_samples: int = 20, dominance: float = 0.8, max_parallel: int = 2):
+        self.modes = modes
+        self.confidence_threshold = confidence_threshold
+        self.min_leads = min_leads
+        self.min_samples = min_samples
+        self.dominance = dominance
+        self.max_parallel = max(1, max_parallel)
+        self.wins: Dict[str, Dict[int, int]] = {}
+
+    def plan(self, doc_type: str) -> Tuple[List[int], List[int]]:
+        """Return (modes to try now, modes to try only if none of those pass), best first"""
+        wins = self.wins.get(doc_type, {})
+        ordered = sorted(self.modes, key=lambda psm: -wins.get(psm, 0))
+        total = sum(wins.values())
+        if total >= self.min_samples and wins.get(ordered[0], 0) / total >= self.dominance:
+            return ordered[:1], ordered[1:]
+        return ordered, []
+
+    def record(self, doc_type: str, psm: int):
+        by_mode = self.wins.setdefault(doc_type, {})
+        by_mode[psm] = by_mode.get(psm, 0) + 1
+
+    def passes(self, confidence: float, leads: int) -> bool:
+        return confidence >= self.confidence_threshold and leads >= self.min_leads
+
+    def stats(self) -> Dict[str, Dict[int, int]]:
+        return {doc_type: dict(by_mode) for doc_type, by_mode in self.wins.items()}
+
+async def extract_image_text_adaptive(pool: 'OCRWorkerPool', strategy: PSMStrategy, source: DocumentSource,
+                                      count_leads: Callable[[str], int],
+                                      preprocessor: Optional[ImagePreprocessor] = None,
+                                      guard: Optional[ResourceGuard] = None) -> Tuple[str, List[str]]:
+    """OCR an image with the PSM strategy: learned ordering, a few attempts at a time, early exit.
+
+    The image header is checked against the `guard`'s pixel limit first; the
+    image is then decoded and preprocessed once, and every PSM attempt works on
+    the (much smaller) prepared bitmap. Returns the text and its contact blocks.
+    """
+    (guard or ResourceGuard(ResourceLimits())).check_image(source)
+    doc_type = classify_document(source)
+    preprocessor = preprocessor or ImagePreprocessor(PreprocessSettings())
+    prepared, prepare_stats = await pool.run(prepare_image, source, preprocessor.settings)
+    preprocessor.record(prepare_stats)
+    primary, fallback = strategy.plan(doc_type)
+    best = None  # (leads, confidence, length, psm, text, blocks)
+    for modes in (primary, fallback):
+        if not modes:
+            continue
+        waiting = deque(modes)
+        running: Set[asyncio.Future] = set()
+        try:
+            while waiting or running:
+                while waiting and len(running) < strategy.max_parallel:
+                    running.add(asyncio.ensure_future(pool.run(ocr_image_with_psm, prepared, waiting.popleft())))
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    try:
+                        psm, text, confidence, blocks = attempt.result()
+                    except asyncio.TimeoutError:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"OCR attempt failed: {e}")
+                        continue
+                    leads = count_leads(text) if text.strip() else 0
+                    candidate = (leads, confidence, len(text.strip()), psm, text, blocks)
+                    if best is None or candidate[:3] > best[:3]:
+                        best = candidate
+                    if strategy.passes(confidence, leads):
+                        logger.info(f"PSM {psm} accepted for {doc_type} image (confidence {confidence:.0f}, {leads} leads)")
+                        strategy.record(doc_type, psm)
+                        return text, blocks
+        finally:
+            for attempt in running:
+                attempt.cancel()
+    if best is None or not best[4].strip():
+        raise OCRError("No text could be extracted from the image")
+    strategy.record(doc_type, best[3])
+    return best[4], best[5]
+
+# PDF pipeline
+async def iter_pdf_pages(pool: 'OCRWorkerPool', source: DocumentSource, dpi: int, max_pages: int,
+                         min_text_chars: int = 20, preprocess: PreprocessSettings = PreprocessSettings(),
+                         guard: Optional[ResourceGuard] = None, batch_pages: int = 20) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the pages of a PDF as soon as their text is available.
+
+    The text layer is read `batch_pages` pages per pool job, with at most one
+    job per worker in flight, and each range's pages are yielded in page order
+    as soon as it is read; nothing is kept of a page once it has been yielded.
+    Pages whose text layer has fewer than `min_text_chars` characters are
+    rasterized and OCRed instead, one pool job per page (the first `max_pages`
+    of them), started as soon as their range has been read and yielded in the
+    order they finish, so only one page bitmap per worker is alive at a time.
+    Each page is a dict with page, method (text, ocr or skipped), seconds,
+    text and contact blocks (layout blocks of OCRed pages, the whole text of
+    text-layer pages). In-memory PDFs are written to a temporary file if they
+    span several ranges or some page needs rasterizing, since poppler reads
+    from disk and the bytes would otherwise be copied into every job.
+
+    The `guard` rejects PDFs with too many pages before any text is read, and
+    picks each page's DPI so its bitmap fits the pixel budget.
+    """
+    guard = guard or ResourceGuard(ResourceLimits())
+    try:
+        count = await pool.run(pdf_page_count, source, guard.limits.max_pdf_pages)
+    except DocumentTooLarge:
+        guard.record('pdfsRejected')
+        raise
+    guard.record('pdfsAdmitted')
+
+    spooled_path = None
+
+    def on_disk() -> str:
+        nonlocal spooled_path
+        if not isinstance(source, bytes):
+            return source
+        if spooled_path is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as spooled:
+                spooled.write(source)
+            spooled_path = spooled.name
+        return spooled_path
+
+    ranges = deque((first, min(first + batch_pages - 1, count)) for first in range(1, count + 1, batch_pages))
+    reading: Deque[Tuple[int, asyncio.Future]] = deque()  # text layer jobs, in page order
+    ocr_tasks: Set[asyncio.Future] = set()
+    scanned: Dict[int, Dict[str, Any]] = {}  # pages waiting for their OCR job
+    ocr_started = 0
+    has_text = False
+    failures = []
+    try:
+        while ranges or reading or ocr_tasks:
+            while ranges and len(reading) < max(1, pool.max_workers):
+                first, last = ranges.popleft()
+                layer_source = on_disk() if count > batch_pages else source
+                reading.append((first, asyncio.ensure_future(pool.run(extract_pdf_text_layer, layer_source, first, last))))
+            waiting = set(ocr_tasks)
+            if reading:
+                waiting.add(reading[0][1])
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            # Text layer ranges are consumed in page order
+            while reading and reading[0][1].done():
+                first, task = reading.popleft()
+                for number, (text, seconds, size) in enumerate(task.result(), start=first):
+                    page = {'page': number, 'method': 'text', 'seconds': seconds, 'text': text, 'blocks': [text], 'size': size}
+                    has_text = has_text or bool(text.strip())
+                    if len(text.strip()) < min_text_chars:
+                        page['dpi'] = guard.page_dpi(size, dpi) if ocr_started < max_pages else None
+                        if page['dpi'] is None:
+                            page['method'] = 'skipped'
+                        else:
+                            ocr_started += 1
+                            scanned[number] = page
+                            ocr_tasks.add(asyncio.ensure_future(
+                                pool.run(ocr_pdf_page, on_disk(), number, page['dpi'], preprocess)
+                            ))
+                            continue
+                    yield page
+
+            for task in done & ocr_tasks:
+                ocr_tasks.discard(task)
+                try:
+                    page_number, page_text, seconds, blocks = task.result()
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"PDF page OCR failed: {e}")
+                    failures.append(e)
+                    continue
+                page = scanned.pop(page_number)
+                if page_text.strip() or not page['text'].strip():
+                    page.update(method='ocr', text=page_text, blocks=blocks)
+                page['seconds'] += seconds
+                has_text = has_text or bool(page['text'].strip())
+                yield page
+        if failures and len(failures) == ocr_started and not has_text:
+            raise OCRError(f"Failed to extract text from PDF: {str(failures[0])}")
+        # Pages whose OCR failed keep their (short) text layer
+        for page in scanned.values():
+            yield page
+    finally:
+        tasks = [task for _, task in reading] + list(ocr_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if spooled_path:
+            os.unlink(spooled_path)
+
+async def extract_text_from_pdf(pool: 'OCRWorkerPool', source: DocumentSource, dpi: int, max_pages: int,
+                                min_text_chars: int = 20, preprocess: PreprocessSettings = PreprocessSettings(),
+                                guard: Optional[ResourceGuard] = None,
+                                batch_pages: int = 20) -> Tuple[str, List[Dict[str, Any]], List[str]]:
+    """Extract text from PDF, choosing text layer or OCR for each page separately (see `iter_pdf_pages`).
+
+    Returns the merged text in page order, per-page info (page, method, ms)
+    and the contact blocks of all pages.
+    """
+    pages = [page async for page in iter_pdf_pages(pool, source, dpi, max_pages, min_text_chars, preprocess, guard, batch_pages)]
+    pages.sort(key=lambda page: page['page'])
+
+    text = ""
+    for page in pages:
+        if not page['text'].strip():
+            continue
+        if page['method'] == 'ocr':
+            text += f"Page {page['page']}:\n{page['text']}\n"
+        else:
+            text += page['text'] + "\n"
+    logger.info(f"PDF pages: {sum(p['method'] == 'text' for p in pages)} from text layer, "
+                f"{sum(p['method'] == 'ocr' for p in pages)} OCRed")
+    page_info = [{'page': p['page'], 'method': p['method'], 'ms': round(p['seconds'] * 1000, 1)} for p in pages]
+    blocks = [block for p in pages for block in p['blocks'] if block.strip()]
+    return text, page_info, blocks
+
+# Result cache
+class ExtractionCache:
+    """Content-addressed cache of upload extraction results.
+
+    Keys are the SHA-256 of the uploaded bytes plus the extraction settings, so
+    a settings change never serves stale results. Entries live in a memory LRU
+    and as JSON files under `folder`; both tiers evict least recently used
+    entries once their byte budget is exceeded.
+    """
+
+    def __init__(self, folder: str, memory_bytes: int, disk_bytes: int):
+        self.folder = folder
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._memory_used = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> file size, least recently used first
+        self._disk_used = 0
+        self.counters = {'memoryHits': 0, 'diskHits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(content_hash: str, settings: str) -> str:
+        """Cache key from the SHA-256 hex digest of an upload (hashed while it streams in) and the settings"""
+        return hashlib.sha256(f"{content_hash}\0{settings}".encode()).hexdigest()
+
+    def load(self):
+        """Index the disk tier left by previous runs"""
+        os.makedirs(self.folder, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.folder, name))
+                entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        self._evict_disk()
+        logger.info(f"Extraction cache: {len(self._disk)} entries ({self._disk_used} bytes) on disk")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.counters['memoryHits'] += 1
+            return self._memory[key][0]
+        if key in self._disk:
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    raw = f.read()
+                value = json.loads(raw)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+                self._drop_disk(key)
+            else:
+                self._disk.move_to_end(key)
+                os.utime(path)  # keep disk recency across restarts
+                self._remember(key, value, len(raw))
+                self.counters['diskHits'] += 1
+                return value
+        self.counters['misses'] += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        raw = json.dumps(value)
+        self._remember(key, value, len(raw))
+        path = self._path(key)
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(raw)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            return
+        self._disk_used += len(raw) - self._disk.pop(key, 0)
+        self._disk[key] = len(raw)
+        self._evict_disk()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.counters,
+            'memoryEntries': len(self._memory),
+            'memoryBytes': self._memory_used,
+            'diskEntries': len(self._disk),
+            'diskBytes': self._disk_used,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.json")
+
+    def _remember(self, key: str, value: Dict[str, Any], size: int):
+        if key in self._memory:
+            self._memory_used -= self._memory.pop(key)[1]
+        if size > self.memory_bytes:
+            return
+        self._memory[key] = (value, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_used -= evicted
+
+    def _drop_disk(self, key: str):
+        self._disk_used -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk_used > self.disk_bytes and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+
+# OCR engines
+OCR_ENGINES = ('auto', 'tesserocr', 'pytesseract')
+
+def resolve_ocr_engine(name: str) -> str:
+    """Concrete engine for a configured name; 'auto' prefers tesserocr when it is installed"""
+    if name not in OCR_ENGINES:
+        raise ValueError(f"Unknown OCR engine '{name}', expected one of: {', '.join(OCR_ENGINES)}")
+    # Only look the package up: importing it here would load libtesseract into the server process
+    installed = importlib.util.find_spec('tesserocr') is not None
+    if name == 'auto':
+        return 'tesserocr' if installed else 'pytesseract'
+    if name == 'tesserocr' and not installed:
+        raise ValueError("OCR engine 'tesserocr' requested but the tesserocr package is not installed")
+    return name
+
+class PytesseractEngine:
+    """Runs the tesseract command line per call, paying a process spawn and a model load each time"""
+    name = 'pytesseract'
+
+    def image_to_data(self, image: Image.Image, psm: int) -> Dict[str, List]:
+        config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist={OCR_CHAR_WHITELIST}'
+        return pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+
+class TesserocrEngine:
+    """An initialized tesseract API kept for the life of the worker, so the model is loaded once"""
+    name = 'tesserocr'
+    TSV_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                   'left', 'top', 'width', 'height', 'conf', 'text')
+
+    def __init__(self):
+        import tesserocr
+        self.api = tesserocr.PyTessBaseAPI(oem=tesserocr.OEM.DEFAULT)
+        self.api.SetVariable('tessedit_char_whitelist', OCR_CHAR_WHITELIST)
+
+    def image_to_data(self, image: Image.Image, psm: int) -> Dict[str, List]:
+        """Same dict layout as pytesseract's image_to_data, built from tesseract's TSV renderer"""
+        self.api.SetPageSegMode(psm)
+        self.api.SetImage(image)
+        try:
+            tsv = self.api.GetTSVText(0)
+        finally:
+            self.api.Clear()
+        data: Dict[str, List] = {column: [] for column in self.TSV_COLUMNS}
+        for row in tsv.splitlines():
+            values = row.split('\t', len(self.TSV_COLUMNS) - 1)
+            values += [''] * (len(self.TSV_COLUMNS) - len(values))  # rows for blocks/lines have no text
+            for column, value in zip(self.TSV_COLUMNS, values):
+                if column == 'text':
+                    data[column].append(value)
+                elif column == 'conf':
+                    data[column].append(float(value))
+                else:
+                    data[column].append(int(value))
+        return data
+
+_engine_name = 'pytesseract'
+_engine: Optional[Union[PytesseractEngine, TesserocrEngine]] = None
+
+def ocr_engine() -> Union[PytesseractEngine, TesserocrEngine]:
+    """This worker's OCR engine, created on first use and reused by every later job"""
+    global _engine
+    if _engine is None:
+        if _engine_name == 'tesserocr':
+            try:
+                _engine = TesserocrEngine()
+            except Exception as e:
+                logger.warning(f"tesserocr could not be initialized ({e}), falling back to pytesseract")
+                _engine = PytesseractEngine()
+        else:
+            _engine = PytesseractEngine()
+    return _engine
+
+# Worker pool
+def _init_worker(engine: str = 'pytesseract'):
+    # Workers already run in parallel; stop each tesseract from also spawning OpenMP threads
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    global _engine_name
+    _engine_name = engine
+
+def _warm_up() -> bool:
+    """Job used to spawn worker processes and load the OCR model ahead of the first upload"""
+    ocr_engine()
+    return True
+
+def _release_from_thread(loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore):
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        pass  # the event loop is already closed
+
+class OCRWorkerPool:
+    """Process pool that keeps OCR and PDF rasterization off the event loop.
+
+    Jobs are handed to the pool only when a worker is free, so the timeout
+    measures the time a job runs, not the time it waited for a worker. Jobs
+    that exceed their timeout get the pool's worker processes terminated (a
+    running job can't be cancelled otherwise); jobs that were running next to
+    it are retried once on the fresh pool.
+    """
+
+    def __init__(self, max_workers: int, timeout: float, engine: str = 'pytesseract'):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.engine = engine
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._free_workers: Optional[asyncio.Semaphore] = None
+        self._free_workers_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        if self._executor is None:
+            # spawn, not fork: the server process has running threads and an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(self.engine,)
+            )
+            for _ in range(self.max_workers):
+                self._executor.submit(_warm_up)
+            logger.info(f"Started OCR worker pool with {self.max_workers} processes ({self.engine} engine)")
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _worker_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._free_workers_loop is not loop:
+            self._free_workers = asyncio.Semaphore(max(1, self.max_workers))
+            self._free_workers_loop = loop
+        return self._free_workers
+
+    async def run(self, func: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """Run `func(*args)` in a worker process, raising asyncio.TimeoutError after the timeout.
+
+        The timeout starts once a worker is free to take the job; a job still
+        waiting for one never times out and never recycles the pool.
+        """
+        loop = asyncio.get_running_loop()
+        slots = self._worker_slots()
+        for attempt in range(2):
+            await slots.acquire()
+            executor = self.start()
+            try:
+                job = executor.submit(func, *args)
+            except BaseException:
+                slots.release()
+                raise
+            # The worker stays taken until the job really ends, even if the caller stops waiting for it
+            job.add_done_callback(lambda _: _release_from_thread(loop, slots))
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(job), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"OCR job {func.__name__} timed out after {timeout or self.timeout}s, recycling workers")
+                self._recycle(executor)
+                raise
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                logger.warning(f"OCR worker pool was recycled while running {func.__name__}, retrying")
+                self._recycle(executor)
+
+    def _recycle(self, executor: ProcessPoolExecutor):
+        if self._executor is not executor:
+            return
+        self._executor = None
+        # ProcessPoolExecutor has no public way to stop a running job
+        for process in list(getattr(executor, '_processes', {}).values()):
+            process.terminate()
+        # Queued jobs are not cancelled: they fail with BrokenProcessPool and get retried on the fresh pool
+        executor.shutdown(wait=False)
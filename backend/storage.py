@@ -0,0 +1,883 @@
+"""
+Lead persistence backends and the process-resident lead store
+"""
+import argparse
+import base64
+import bisect
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LEAD_COLUMNS = ['id', 'name', 'email', 'phone', 'status', 'source', 'createdAt']
+SORT_FIELDS = ('createdAt', 'name')
+FILTER_FIELDS = ('status', 'source')
+SEARCH_CACHE_SIZE = 32  # sorted prefix-search results kept for the current store version
+
+class LeadStorageError(Exception):
+    """A mutation could not be written to the storage backend (and was undone in memory)"""
+
+# CSV helpers
+def initialize_csv(csv_file: str):
+    """Initialize CSV file if it doesn't exist"""
+    if not os.path.exists(csv_file):
+        df = pd.DataFrame(columns=LEAD_COLUMNS)
+        df.to_csv(csv_file, index=False)
+        logger.info(f"Created new CSV file: {csv_file}")
+
+def read_leads_from_csv(csv_file: str) -> List[Dict]:
+    """Read leads from CSV file"""
+    try:
+        if os.path.exists(csv_file):
+            # Read everything as text so phone numbers keep their leading '+' and zeros
+            df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+            df = df.fillna('')
+            return df.to_dict('records')
+        return []
+    except Exception as e:
+        logger.error(f"Error reading CSV: {e}")
+        return []
+
+def write_leads_to_csv(csv_file: str, leads: List[Dict]) -> bool:
+    """Write leads to CSV file (atomically, via a temporary file)"""
+    try:
+        df = pd.DataFrame(leads, columns=LEAD_COLUMNS)
+        temp_path = f"{csv_file}.tmp"
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, csv_file)
+        logger.info(f"Wrote {len(leads)} leads to CSV")
+        return True
+    except Exception as e:
+        logger.error(f"Error writing CSV: {e}")
+        return False
+
+# Storage backends
+class LeadStorage:
+    """Interface implemented by every lead persistence backend.
+
+    The LeadStore keeps all leads in memory and calls `write` with the leads
+    touched by each mutation; backends decide how much of that they persist.
+    """
+
+    name = 'base'
+
+    def initialize(self):
+        """Create empty storage if it doesn't exist yet"""
+
+    def load(self) -> Dict[str, Dict]:
+        """Return every persisted lead keyed by id"""
+        raise NotImplementedError
+
+    def write(self, leads: Dict[str, Dict], changed: List[Dict], deleted: List[str]) -> bool:
+        """Persist one mutation; `leads` is the full state after it was applied"""
+        raise NotImplementedError
+
+    def open(self, compact_callback: Callable[[], None]):
+        """Start any background work (called once leads are loaded)"""
+
+    def begin_compaction(self) -> bool:
+        """Prepare to fold pending writes into a snapshot; called with the store locked"""
+        return False
+
+    def finish_compaction(self, snapshot: List[Dict]):
+        """Write the snapshot taken alongside `begin_compaction`"""
+
+    def close(self):
+        """Release files and connections"""
+
+class CSVStorage(LeadStorage):
+    """Rewrites the whole CSV file on every mutation"""
+
+    name = 'csv'
+
+    def __init__(self, csv_file: str):
+        self.csv_file = csv_file
+
+    def initialize(self):
+        initialize_csv(self.csv_file)
+
+    def load(self) -> Dict[str, Dict]:
+        return {lead['id']: lead for lead in read_leads_from_csv(self.csv_file) if lead.get('id')}
+
+    def write(self, leads: Dict[str, Dict], changed: List[Dict], deleted: List[str]) -> bool:
+        return write_leads_to_csv(self.csv_file, list(leads.values()))
+
+class LeadJournal:
+    """Append-only write-ahead log of lead mutations.
+
+    Each mutation is appended as one compact JSON line ({"op": "put", "lead": {...}}
+    or {"op": "del", "id": "..."}) and flushed to the OS immediately, so it survives
+    a process crash. fsync is batched every `fsync_interval` seconds by a background
+    thread, which also asks the store to compact the log into a fresh snapshot once
+    it grows past `compact_bytes` or `compact_interval` seconds have passed.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 0.05,
+                 compact_interval: float = 60, compact_bytes: int = 4 * 1024 * 1024):
+        self.path = path
+        self.frozen_path = f"{path}.compacting"
+        self.fsync_interval = fsync_interval
+        self.compact_interval = compact_interval
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_compaction = time.monotonic()
+
+    def replay(self, leads: Dict[str, Dict]) -> int:
+        """Apply a segment left over from an interrupted compaction, then the active log"""
+        applied = 0
+        for path in (self.frozen_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write; everything before it is intact
+                        logger.warning(f"Skipping unreadable journal record {path}:{line_number}")
+                        continue
+                    if record.get('op') == 'put':
+                        leads[record['lead']['id']] = record['lead']
+                    elif record.get('op') == 'del':
+                        leads.pop(record['id'], None)
+                    applied += 1
+        if applied:
+            logger.info(f"Replayed {applied} journal records")
+        return applied
+
+    def start(self, compact_callback: Callable[[], None]):
+        """Open the log for appending and start the fsync/compaction thread"""
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn_tail = f.read(1) != b'\n'
+        else:
+            torn_tail = False
+        self._file = self._open_active()
+        if torn_tail:
+            # Terminate a torn record so the next append starts on its own line
+            self._file.write(b'\n')
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._background_loop, args=(compact_callback,), name="lead-journal", daemon=True
+        )
+        self._thread.start()
+
+    def append(self, records: List[Dict]):
+        """Write records to the log, or raise OSError with none of them in it"""
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8')
+        with self._lock:
+            start = self._file.tell()
+            try:
+                written = 0
+                while written < len(data):
+                    written += self._file.write(data[written:])
+            except OSError:
+                # Drop a partly written batch so a later append can't complete it and replay can't apply it
+                try:
+                    os.ftruncate(self._file.fileno(), start)
+                except OSError as e:
+                    logger.error(f"Could not remove a partly written journal record from {self.path}: {e}")
+                raise
+            self._dirty = True
+
+    def _open_active(self):
+        # Unbuffered: every append reaches the OS right away, and a failed one leaves nothing behind to flush later
+        return open(self.path, 'ab', buffering=0)
+
+    def sync(self):
+        with self._lock:
+            if self._dirty and self._file:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def size(self) -> int:
+        with self._lock:
+            return self._file.tell() if self._file else 0
+
+    def needs_compaction(self) -> bool:
+        size = self.size()
+        if size >= self.compact_bytes:
+            return True
+        return size > 0 and time.monotonic() - self._last_compaction >= self.compact_interval
+
+    def rotate(self):
+        """Freeze the active log for compaction and start a new empty one.
+
+        Must be called while the store is locked so the snapshot taken alongside
+        it reflects exactly the records in the frozen segment.
+        """
+        with self._lock:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if os.path.exists(self.frozen_path):
+                # A previous compaction failed; keep its records ahead of ours
+                with open(self.frozen_path, 'a', encoding='utf-8') as frozen, open(self.path, 'r', encoding='utf-8') as active:
+                    frozen.write(active.read())
+                    frozen.flush()
+                    os.fsync(frozen.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.frozen_path)
+            self._file = self._open_active()
+            self._dirty = False
+
+    def discard_frozen(self):
+        """Drop the frozen segment once its snapshot is safely on disk"""
+        if os.path.exists(self.frozen_path):
+            os.remove(self.frozen_path)
+        self._last_compaction = time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.sync()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _background_loop(self, compact_callback: Callable[[], None]):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.sync()
+                if self.needs_compaction():
+                    compact_callback()
+            except Exception as e:
+                logger.error(f"Journal maintenance failed: {e}")
+
+class JournaledCSVStorage(CSVStorage):
+    """CSV snapshot plus an append-only journal of mutations since the snapshot"""
+
+    name = 'journal'
+
+    def __init__(self, csv_file: str, journal: LeadJournal):
+        super().__init__(csv_file)
+        self.journal = journal
+
+    def load(self) -> Dict[str, Dict]:
+        leads = super().load()
+        self.journal.replay(leads)
+        return leads
+
+    def write(self, leads: Dict[str, Dict], changed: List[Dict], deleted: List[str]) -> bool:
+        records = [{'op': 'put', 'lead': lead} for lead in changed]
+        records.extend({'op': 'del', 'id': lead_id} for lead_id in deleted)
+        self.journal.append(records)
+        return True
+
+    def open(self, compact_callback: Callable[[], None]):
+        self.journal.start(compact_callback)
+
+    def begin_compaction(self) -> bool:
+        self.journal.rotate()
+        return True
+
+    def finish_compaction(self, snapshot: List[Dict]):
+        if write_leads_to_csv(self.csv_file, snapshot):
+            self.journal.discard_frozen()
+            logger.info(f"Compacted journal into snapshot of {len(snapshot)} leads")
+
+    def close(self):
+        self.journal.close()
+
+class SQLiteStorage(LeadStorage):
+    """SQLite database in WAL mode with single-row upserts and deletes.
+
+    `id` and `email` are unique; `status`, `source` and `createdAt` carry
+    secondary indexes for filtered reads by other tools. On first use the
+    database is seeded once from `migrate_from` (the legacy leads.csv).
+    """
+
+    name = 'sqlite'
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_file: str, migrate_from: Optional[str] = None):
+        self.db_file = db_file
+        self.migrate_from = migrate_from
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    def initialize(self):
+        conn = self._connect()
+        with conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS leads (
+                    id TEXT NOT NULL,
+                    name TEXT NOT NULL DEFAULT '',
+                    email TEXT NOT NULL,
+                    phone TEXT NOT NULL DEFAULT '',
+                    status TEXT NOT NULL DEFAULT 'New',
+                    source TEXT NOT NULL DEFAULT 'Manual',
+                    createdAt TEXT NOT NULL DEFAULT ''
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS leads_id_idx ON leads(id);
+                CREATE UNIQUE INDEX IF NOT EXISTS leads_email_idx ON leads(email);
+                CREATE INDEX IF NOT EXISTS leads_status_idx ON leads(status);
+                CREATE INDEX IF NOT EXISTS leads_source_idx ON leads(source);
+                CREATE INDEX IF NOT EXISTS leads_created_at_idx ON leads(createdAt);
+            """)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < self.SCHEMA_VERSION:
+            if self.migrate_from and os.path.exists(self.migrate_from):
+                self.migrate_csv(self.migrate_from)
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def migrate_csv(self, csv_file: str) -> int:
+        """Import every lead from a CSV file, skipping duplicate ids/emails"""
+        leads = read_leads_from_csv(csv_file)
+        rows = [self._row(lead) for lead in leads if lead.get('id') and lead.get('email')]
+        conn = self._connect()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                f"INSERT OR IGNORE INTO leads ({', '.join(LEAD_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in LEAD_COLUMNS)})",
+                rows,
+            )
+            imported = conn.total_changes - before
+        skipped = len(leads) - imported
+        logger.info(f"Migrated {imported} leads from {csv_file} to {self.db_file}"
+                    + (f" ({skipped} skipped as invalid or duplicate)" if skipped else ""))
+        return imported
+
+    def load(self) -> Dict[str, Dict]:
+        cursor = self._connect().execute(f"SELECT {', '.join(LEAD_COLUMNS)} FROM leads ORDER BY rowid")
+        return {row['id']: dict(row) for row in cursor}
+
+    def write(self, leads: Dict[str, Dict], changed: List[Dict], deleted: List[str]) -> bool:
+        try:
+            conn = self._connect()
+            with conn:
+                if deleted:
+                    conn.executemany("DELETE FROM leads WHERE id = ?", [(lead_id,) for lead_id in deleted])
+                if changed:
+                    updates = ', '.join(f"{column} = excluded.{column}" for column in LEAD_COLUMNS[1:])
+                    conn.executemany(
+                        f"INSERT INTO leads ({', '.join(LEAD_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in LEAD_COLUMNS)}) "
+                        f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                        [self._row(lead) for lead in changed],
+                    )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error writing leads to SQLite: {e}")
+            return False
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _row(lead: Dict) -> tuple:
+        return tuple(str(lead.get(column, '') or '') for column in LEAD_COLUMNS)
+
+# In-memory indexes
+class SortedIndex:
+    """Sorted list of (sort value, lead id) keys supporting keyset iteration"""
+
+    def __init__(self, keys: Optional[List[Tuple[str, str]]] = None):
+        self._keys: List[Tuple[str, str]] = sorted(keys) if keys else []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Tuple[str, str]):
+        bisect.insort(self._keys, key)
+
+    def add_many(self, keys: List[Tuple[str, str]]):
+        """Insert many keys with one linear merge instead of repeated insorts"""
+        if len(keys) < 32:
+            for key in keys:
+                bisect.insort(self._keys, key)
+        else:
+            self._keys = list(heapq.merge(self._keys, sorted(keys)))
+
+    def remove(self, key: Tuple[str, str]):
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def remove_many(self, keys: List[Tuple[str, str]]):
+        """Remove many keys with one linear filter instead of repeated deletes"""
+        if len(keys) < 32:
+            for key in keys:
+                self.remove(key)
+        else:
+            drop = set(keys)
+            self._keys = [key for key in self._keys if key not in drop]
+
+    def iter_after(self, after: Optional[Tuple[str, str]] = None, descending: bool = False) -> Iterator[Tuple[str, str]]:
+        """Yield keys strictly after `after` in the requested direction"""
+        keys = self._keys
+        if descending:
+            i = bisect.bisect_left(keys, after) if after is not None else len(keys)
+            for j in range(i - 1, -1, -1):
+                yield keys[j]
+        else:
+            i = bisect.bisect_right(keys, after) if after is not None else 0
+            for j in range(i, len(keys)):
+                yield keys[j]
+
+    def iter_prefix(self, prefix: str) -> Iterator[Tuple[str, str]]:
+        """Yield keys whose sort value starts with `prefix`"""
+        keys = self._keys
+        for j in range(bisect.bisect_left(keys, (prefix,)), len(keys)):
+            if not keys[j][0].startswith(prefix):
+                break
+            yield keys[j]
+
+def sort_key(lead: Dict, field: str) -> Tuple[str, str]:
+    value = str(lead.get(field, '') or '')
+    if field in ('name', 'email'):
+        value = value.lower()
+    return (value, lead['id'])
+
+def encode_cursor(key: Tuple[str, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        value, lead_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (str(value), str(lead_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+# In-memory store
+class LeadStore:
+    """Process-resident lead store indexed by id and lowercased email.
+
+    Leads are loaded from the storage backend once at startup; reads, duplicate
+    checks and updates are served from memory and the backend is only used for
+    persistence. Stored lead dicts are never mutated in place, so a shallow copy
+    of the store is a consistent snapshot.
+
+    Sorted indexes per sort field (overall and per status/source value) back
+    keyset-paginated queries, so fetching a page doesn't depend on store size.
+    A prefix search sorts its matches once per store version; later pages of
+    the same search walk that cached result.
+
+    `version` increases with every mutation and is seeded from the clock at
+    load, so it keeps increasing across restarts and can be used as an ETag.
+    The last `change_log_size` mutations are kept as (version, lead id) entries
+    so clients can fetch only what changed since a version they hold.
+    """
+
+    def __init__(self, storage: LeadStorage, change_log_size: int = 10000):
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._storage = storage
+        self._leads: Dict[str, Dict] = {}
+        self._email_index: Dict[str, str] = {}
+        self._version = int(time.time() * 1000)
+        self._change_log_size = change_log_size
+        self._change_log: deque = deque()
+        self._change_log_floor = self._version
+        self._listeners: List[Callable[[int, List[Dict], List[str]], None]] = []
+        self._search_cache: "OrderedDict[tuple, SortedIndex]" = OrderedDict()
+        self._search_cache_version = None
+        self._build_sorted_indexes()
+
+    @property
+    def storage(self) -> LeadStorage:
+        return self._storage
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def add_listener(self, listener: Callable[[int, List[Dict], List[str]], None]):
+        """Call `listener(version, changed leads, deleted ids)` after every mutation"""
+        self._listeners.append(listener)
+
+    def load(self) -> int:
+        """(Re)load all leads from storage and rebuild the indexes"""
+        with self._lock:
+            self._storage.initialize()
+            leads = self._storage.load()
+            self._leads = leads
+            self._email_index = {}
+            for lead_id, lead in leads.items():
+                email = lead.get('email', '').lower()
+                if email:
+                    self._email_index[email] = lead_id
+            self._build_sorted_indexes()
+            self._version = max(self._version + 1, int(time.time() * 1000))
+            # Nothing before this load is in the change log, so older versions must resync
+            self._change_log.clear()
+            self._change_log_floor = self._version
+            logger.info(f"Loaded {len(self._leads)} leads into memory from {self._storage.name} storage")
+            return len(self._leads)
+
+    def open(self):
+        """Start the backend's background work (journaling, compaction)"""
+        self._storage.open(self.compact)
+
+    def close(self):
+        """Fold pending writes into a snapshot and release the backend"""
+        self.compact()
+        self._storage.close()
+
+    def compact(self):
+        """Write a fresh snapshot and discard the pending writes it contains"""
+        with self._compaction_lock:
+            with self._lock:
+                snapshot = list(self._leads.values())
+                if not self._storage.begin_compaction():
+                    return
+            self._storage.finish_compaction(snapshot)
+
+    def __len__(self) -> int:
+        return len(self._leads)
+
+    def all(self) -> List[Dict]:
+        with self._lock:
+            return list(self._leads.values())
+
+    def iter_chunks(self, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+        """Yield a point-in-time snapshot of all leads in chunks"""
+        snapshot = self.all()
+        for start in range(0, len(snapshot), chunk_size):
+            yield snapshot[start:start + chunk_size]
+
+    def get(self, lead_id: str) -> Optional[Dict]:
+        return self._leads.get(lead_id)
+
+    def get_by_email(self, email: str) -> Optional[Dict]:
+        lead_id = self._email_index.get(email.lower())
+        return self._leads.get(lead_id) if lead_id else None
+
+    def query(self, status: Optional[str] = None, source: Optional[str] = None, q: Optional[str] = None,
+              sort: str = 'createdAt', descending: bool = False, limit: Optional[int] = None,
+              cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str], Optional[int]]:
+        """Return one page of leads plus the cursor for the next page and the match count.
+
+        The count is None when it can't be known without scanning (status and
+        source filters combined). Raises ValueError for a bad sort or cursor.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unsupported sort field '{sort}'")
+        after = decode_cursor(cursor) if cursor else None
+        filters = {field: value for field, value in (('status', status), ('source', source)) if value}
+
+        with self._lock:
+            if q and q.strip():
+                index = self._search(q.strip().lower(), filters, sort)
+                residual = {}
+                total = len(index)
+            elif filters:
+                # Walk the smallest per-value index and check any other filter inline
+                candidates = sorted(
+                    (len(self._filtered[field][sort].get(value, ())), field) for field, value in filters.items()
+                )
+                field = candidates[0][1]
+                index = self._filtered[field][sort].get(filters[field]) or SortedIndex()
+                residual = {other: value for other, value in filters.items() if other != field}
+                total = None if residual else len(index)
+            else:
+                index = self._sorted[sort]
+                residual = {}
+                total = len(index)
+
+            page: List[Dict] = []
+            last_key = None
+            next_cursor = None
+            for key in index.iter_after(after, descending):
+                lead = self._leads[key[1]]
+                if any(lead.get(other) != value for other, value in residual.items()):
+                    continue
+                if limit is not None and len(page) == limit:
+                    next_cursor = encode_cursor(last_key)
+                    break
+                page.append(lead)
+                last_key = key
+            return page, next_cursor, total
+
+    def _search(self, prefix: str, filters: Dict[str, str], sort: str) -> SortedIndex:
+        """Leads whose name or email starts with `prefix`, matching `filters`, sorted by `sort`.
+
+        Built once per store version and search, so paging through the results
+        doesn't re-sort every match for every page.
+        """
+        if self._search_cache_version != self._version:
+            self._search_cache.clear()
+            self._search_cache_version = self._version
+        key = (prefix, tuple(sorted(filters.items())), sort)
+        index = self._search_cache.get(key)
+        if index is not None:
+            self._search_cache.move_to_end(key)
+            return index
+        ids = {lead_id for _, lead_id in self._sorted['name'].iter_prefix(prefix)}
+        ids.update(lead_id for _, lead_id in self._email_sorted.iter_prefix(prefix))
+        index = SortedIndex([
+            sort_key(self._leads[lead_id], sort) for lead_id in ids
+            if all(self._leads[lead_id].get(field) == value for field, value in filters.items())
+        ])
+        self._search_cache[key] = index
+        while len(self._search_cache) > SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        return index
+
+    def changes_since(self, since: int) -> Optional[Tuple[List[Dict], List[str], int]]:
+        """Return (upserted leads, deleted ids, current version) for changes after `since`.
+
+        Returns None when `since` predates the retained change log (or comes from
+        the future), in which case the caller has to resync the full list.
+        """
+        with self._lock:
+            if since < self._change_log_floor or since > self._version:
+                return None
+            changed_ids: Dict[str, None] = {}
+            for version, lead_id in reversed(self._change_log):
+                if version <= since:
+                    break
+                changed_ids[lead_id] = None
+            upserted = []
+            deleted = []
+            for lead_id in reversed(list(changed_ids)):
+                lead = self._leads.get(lead_id)
+                if lead is None:
+                    deleted.append(lead_id)
+                else:
+                    upserted.append(lead)
+            return upserted, deleted, self._version
+
+    def add(self, lead: Dict) -> Dict:
+        with self._lock:
+            previous = {lead['id']: self._leads.get(lead['id'])}
+            self._leads[lead['id']] = lead
+            self._index(lead)
+            if lead.get('email'):
+                self._email_index[lead['email'].lower()] = lead['id']
+            self._persist(previous, changed=[lead])
+            return lead
+
+    def add_many(self, leads: List[Dict]) -> List[Dict]:
+        """Add several new leads with a single save"""
+        with self._lock:
+            previous = {lead['id']: self._leads.get(lead['id']) for lead in leads}
+            for lead in leads:
+                self._leads[lead['id']] = lead
+                if lead.get('email'):
+                    self._email_index[lead['email'].lower()] = lead['id']
+            self._index_many(leads)
+            if leads:
+                self._persist(previous, changed=leads)
+            return leads
+
+    def update(self, lead_id: str, changes: Dict) -> Optional[Dict]:
+        with self._lock:
+            lead = self._leads.get(lead_id)
+            if lead is None:
+                return None
+            old_lead = lead
+            old_email = lead.get('email', '').lower()
+            self._unindex(lead)
+            lead = {**lead, **changes}
+            self._leads[lead_id] = lead
+            self._index(lead)
+            new_email = lead.get('email', '').lower()
+            if new_email != old_email:
+                self._email_index.pop(old_email, None)
+                if new_email:
+                    self._email_index[new_email] = lead_id
+            self._persist({lead_id: old_lead}, changed=[lead])
+            return lead
+
+    def update_many(self, lead_ids: List[str], changes: Dict) -> Dict[str, str]:
+        """Apply the same non-email changes to a set of leads with a single save.
+
+        Runs in O(M) id lookups plus one linear pass per affected sorted index,
+        and returns the outcome per id: 'updated', 'unchanged' or 'not_found'.
+        """
+        if 'email' in changes:
+            raise ValueError("update_many can't change emails; use update()")
+        with self._lock:
+            outcomes: Dict[str, str] = {}
+            old_leads = []
+            new_leads = []
+            for lead_id in dict.fromkeys(lead_ids):
+                lead = self._leads.get(lead_id)
+                if lead is None:
+                    outcomes[lead_id] = 'not_found'
+                elif all(lead.get(field) == value for field, value in changes.items()):
+                    outcomes[lead_id] = 'unchanged'
+                else:
+                    updated = {**lead, **changes}
+                    self._leads[lead_id] = updated
+                    old_leads.append(lead)
+                    new_leads.append(updated)
+                    outcomes[lead_id] = 'updated'
+            if new_leads:
+                self._reindex_many(old_leads, new_leads, list(changes))
+                self._persist({lead['id']: lead for lead in old_leads}, changed=new_leads)
+            return outcomes
+
+    def delete(self, lead_id: str) -> bool:
+        with self._lock:
+            lead = self._leads.pop(lead_id, None)
+            if lead is None:
+                return False
+            self._unindex(lead)
+            self._email_index.pop(lead.get('email', '').lower(), None)
+            self._persist({lead_id: lead}, deleted=[lead_id])
+            return True
+
+    def _build_sorted_indexes(self):
+        leads = list(self._leads.values())
+        self._sorted: Dict[str, SortedIndex] = {
+            field: SortedIndex([sort_key(lead, field) for lead in leads]) for field in SORT_FIELDS
+        }
+        self._email_sorted = SortedIndex([sort_key(lead, 'email') for lead in leads])
+        self._filtered: Dict[str, Dict[str, Dict[str, SortedIndex]]] = {}
+        for field in FILTER_FIELDS:
+            self._filtered[field] = {}
+            for sort in SORT_FIELDS:
+                groups: Dict[str, List[Tuple[str, str]]] = {}
+                for lead in leads:
+                    groups.setdefault(lead.get(field, ''), []).append(sort_key(lead, sort))
+                self._filtered[field][sort] = {value: SortedIndex(keys) for value, keys in groups.items()}
+
+    def _sorted_indexes_for(self, lead: Dict) -> Iterator[Tuple[SortedIndex, Tuple[str, str]]]:
+        for sort in SORT_FIELDS:
+            key = sort_key(lead, sort)
+            yield self._sorted[sort], key
+            for field in FILTER_FIELDS:
+                by_value = self._filtered[field][sort]
+                value = lead.get(field, '')
+                if value not in by_value:
+                    by_value[value] = SortedIndex()
+                yield by_value[value], key
+        yield self._email_sorted, sort_key(lead, 'email')
+
+    def _index(self, lead: Dict):
+        for index, key in self._sorted_indexes_for(lead):
+            index.add(key)
+
+    def _index_many(self, leads: List[Dict]):
+        pending: Dict[SortedIndex, List[Tuple[str, str]]] = {}
+        for lead in leads:
+            for index, key in self._sorted_indexes_for(lead):
+                pending.setdefault(index, []).append(key)
+        for index, keys in pending.items():
+            index.add_many(keys)
+
+    def _reindex_many(self, old_leads: List[Dict], new_leads: List[Dict], fields: List[str]):
+        """Move changed leads between sorted indexes, touching only indexes that `fields` affect"""
+        for sort in SORT_FIELDS:
+            sort_changed = sort in fields
+            affected = [field for field in FILTER_FIELDS if sort_changed or field in fields]
+            if not sort_changed and not affected:
+                continue
+            old_keys = [sort_key(lead, sort) for lead in old_leads]
+            new_keys = [sort_key(lead, sort) for lead in new_leads] if sort_changed else old_keys
+            if sort_changed:
+                self._sorted[sort].remove_many(old_keys)
+                self._sorted[sort].add_many(new_keys)
+            for field in affected:
+                by_value = self._filtered[field][sort]
+                removals: Dict[str, List[Tuple[str, str]]] = {}
+                additions: Dict[str, List[Tuple[str, str]]] = {}
+                for old_lead, new_lead, old_key, new_key in zip(old_leads, new_leads, old_keys, new_keys):
+                    old_value = old_lead.get(field, '')
+                    new_value = new_lead.get(field, '')
+                    if old_value == new_value and old_key == new_key:
+                        continue
+                    removals.setdefault(old_value, []).append(old_key)
+                    additions.setdefault(new_value, []).append(new_key)
+                for value, keys in removals.items():
+                    by_value[value].remove_many(keys)
+                for value, keys in additions.items():
+                    if value not in by_value:
+                        by_value[value] = SortedIndex()
+                    by_value[value].add_many(keys)
+
+    def _unindex(self, lead: Dict):
+        for index, key in self._sorted_indexes_for(lead):
+            index.remove(key)
+
+    def _persist(self, previous: Dict[str, Optional[Dict]], changed: List[Dict] = (), deleted: List[str] = ()):
+        """Store a mutation already applied in memory, then publish it.
+
+        `previous` maps every touched lead id to its state before the mutation
+        (None for new leads). If the backend can't store it (write returns
+        False or raises), the mutation is undone and LeadStorageError raised,
+        so version, change log and listeners only ever see stored changes.
+        """
+        try:
+            stored = self._storage.write(self._leads, list(changed), list(deleted))
+        except Exception as e:
+            logger.error(f"Error saving leads to {self._storage.name} storage: {e}")
+            stored = False
+        if not stored:
+            self._restore(previous)
+            raise LeadStorageError(f"Failed to save leads to {self._storage.name} storage")
+        self._version += 1
+        self._change_log.extend((self._version, lead['id']) for lead in changed)
+        self._change_log.extend((self._version, lead_id) for lead_id in deleted)
+        while len(self._change_log) > self._change_log_size:
+            dropped_version, _ = self._change_log.popleft()
+            self._change_log_floor = max(self._change_log_floor, dropped_version)
+        for listener in self._listeners:
+            try:
+                listener(self._version, changed, deleted)
+            except Exception as e:
+                logger.error(f"Lead change listener failed: {e}")
+
+    def _restore(self, previous: Dict[str, Optional[Dict]]):
+        """Put leads back to their state before a mutation that couldn't be stored"""
+        for lead_id, before in previous.items():
+            current = self._leads.get(lead_id)
+            if current is not None:
+                self._unindex(current)
+                email = current.get('email', '').lower()
+                if self._email_index.get(email) == lead_id:
+                    del self._email_index[email]
+            if before is None:
+                self._leads.pop(lead_id, None)
+                continue
+            self._leads[lead_id] = before
+            self._index(before)
+            if before.get('email'):
+                self._email_index[before['email'].lower()] = lead_id
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="One-shot migration of leads.csv into a SQLite database")
+    parser.add_argument("--csv", default="leads.csv", help="source CSV file")
+    parser.add_argument("--db", default="leads.db", help="target SQLite database")
+    args = parser.parse_args()
+
+    storage = SQLiteStorage(args.db)
+    storage.initialize()
+    storage.migrate_csv(args.csv)
+    storage.close()
@@ -43,6 +43,71 @@ def test_get_leads():
         print(f"❌ Get Leads Error: {e}")
         return False, []
 
+def test_paginated_leads():
+    """Test keyset pagination of the leads endpoint"""
+    try:
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2, 'sort': 'name'}
+            if cursor:
+                params['cursor'] = cursor
+            response = requests.get(f'{BASE_URL}/leads', params=params, timeout=10)
+            if response.status_code != 200:
+                print(f"❌ Paginated Leads Failed: {response.status_code} - {response.text}")
+                return False
+            seen.extend(lead['id'] for lead in response.json())
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        
+        total = int(response.headers.get('X-Total-Count', len(seen)))
+        if len(seen) == len(set(seen)) == total:
+            print(f"✅ Paginated Leads: OK ({total} leads in pages of 2)")
+            return True
+        print(f"❌ Paginated Leads Failed: got {len(seen)} ids ({len(set(seen))} unique), expected {total}")
+        return False
+    except Exception as e:
+        print(f"❌ Paginated Leads Error: {e}")
+        return False
+
+def test_bulk_import():
+    """Test bulk import: valid rows are created, malformed emails and in-batch duplicates are not"""
+    try:
+        stamp = int(time.time())
+        rows = [
+            {'name': 'Bulk One', 'email': f'bulk_one_{stamp}@example.com', 'phone': 5551234567},
+            {'name': 'Bulk Two', 'email': f'BULK_TWO_{stamp}@Example.com', 'source': 'Import'},
+            {'name': 'Bulk Duplicate', 'email': f'bulk_one_{stamp}@example.com'},
+            {'name': 'Bad Domain', 'email': 'john@-example.com'},
+            {'name': 'Bad Dots', 'email': 'a..b@example.com'},
+            {'name': '', 'email': f'no_name_{stamp}@example.com'},
+        ]
+        response = requests.post(f'{BASE_URL}/leads/bulk', json={'leads': rows}, timeout=30)
+        if response.status_code != 200:
+            print(f"❌ Bulk Import Failed: {response.status_code} - {response.text}")
+            return False
+        statuses = [result['status'] for result in response.json()['results']]
+        expected = ['created', 'created', 'duplicate', 'invalid', 'invalid', 'invalid']
+        if statuses != expected:
+            print(f"❌ Bulk Import Failed: got {statuses}, expected {expected}")
+            return False
+        
+        # Whatever was stored must still serialize as leads
+        listing = requests.get(f'{BASE_URL}/leads', timeout=10)
+        if listing.status_code != 200:
+            print(f"❌ Bulk Import Failed: listing leads afterwards returned {listing.status_code}")
+            return False
+        phones = [lead.get('phone') for lead in listing.json() if lead.get('email') == f'bulk_one_{stamp}@example.com']
+        if phones != ['5551234567']:
+            print(f"❌ Bulk Import Failed: numeric phone stored as {phones}")
+            return False
+        print(f"✅ Bulk Import: OK ({statuses.count('created')} created, {statuses.count('invalid')} invalid)")
+        return True
+    except Exception as e:
+        print(f"❌ Bulk Import Error: {e}")
+        return False
+
 def test_add_lead():
     """Test add lead endpoint"""
     try:
@@ -133,6 +198,12 @@ def main():
     print("\n4. Testing Workflow Execution...")
     test_results.append(test_workflow_execution())
     
+    print("\n5. Testing Paginated Leads...")
+    test_results.append(test_paginated_leads())
+    
+    print("\n6. Testing Bulk Import...")
+    test_results.append(test_bulk_import())
+    
     # Summary
     print("\n" + "=" * 50)
     print("🏁 Test Summary")